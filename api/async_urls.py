@@ -0,0 +1,10 @@
+from django.urls import path
+
+from .async_views import AsyncBlogListView, AsyncBlogDetailView, AsyncCategoryListView, AsyncMeView
+
+urlpatterns = [
+    path('blogs/', AsyncBlogListView.as_view(), name='async-blog-list'),
+    path('blogs/<int:pk>/', AsyncBlogDetailView.as_view(), name='async-blog-detail'),
+    path('categories/', AsyncCategoryListView.as_view(), name='async-category-list'),
+    path('me/', AsyncMeView.as_view(), name='async-me'),
+]
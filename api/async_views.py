@@ -0,0 +1,238 @@
+"""
+Native async versions of the hot read endpoints, for deployments running
+config.asgi. They share the serializers, query plans, filters and
+pagination of the viewsets in api.views and return the same JSON, but
+authenticate, check permissions and read from the database through
+Django's async ORM instead of running the whole request in a sync thread.
+"""
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views import View
+from django_filters import rest_framework as django_filters
+from rest_framework import exceptions, filters
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from blog.models import Blog, Category
+from config.metrics import measure_serialization
+from .authentication import acache_token, aget_cached_token
+from .filters import FullTextSearchFilter
+from .mixins import (
+    apply_field_selection, get_query_plan, make_validator, parse_field_selection, patch_validator_headers
+)
+from .serializers import (
+    CustomUserSerializer, BlogListSerializer, BlogDetailSerializer, CategorySerializer, RelatedPageField
+)
+
+
+async def authenticate(request):
+    """
+    Async counterpart of CachedTokenAuthentication followed by
+    SessionAuthentication. Returns the user, or None for anonymous requests.
+    """
+    auth = request.headers.get('Authorization', '').split()
+    if auth and auth[0].lower() == 'token':
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed('Invalid token header. No credentials provided.')
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed('Invalid token header. Token string should not contain spaces.')
+        token = await aget_cached_token(auth[1])
+        if token is None:
+            try:
+                token = await Token.objects.select_related('user').aget(key=auth[1])
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed('User inactive or deleted.')
+            await acache_token(token)
+        return token.user
+
+    # only safe methods are served here, so the session needs no CSRF check
+    user = await request.auser()
+    if not user or not user.is_active:
+        return None
+    return user
+
+
+class AsyncAPIView(View):
+    """
+    Read-only async view with APIView semantics: DRF permissions, exception
+    handling and JSON rendering. The wrapped DRF request is only used as a
+    carrier for the user and query params, it never authenticates itself.
+    """
+
+    http_method_names = ['get', 'head', 'options']
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    renderer = JSONRenderer()
+    www_authenticate = 'Token'
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args, self.kwargs = args, kwargs
+        self.request = Request(request, authenticators=())
+        self.request.accepted_renderer = self.renderer
+        self.request.accepted_media_type = self.renderer.media_type
+        try:
+            user = await authenticate(request)
+            self.request.user = user or AnonymousUser()
+            self.check_permissions(self.request)
+            if request.method.lower() not in self.http_method_names:
+                raise exceptions.MethodNotAllowed(request.method)
+            response = await getattr(self, request.method.lower())(self.request, *args, **kwargs)
+        except (exceptions.APIException, Http404) as exc:
+            response = self.handle_exception(exc)
+        return self.finalize_response(response)
+
+    def get_permissions(self):
+        return [permission() for permission in self.permission_classes]
+
+    def check_permissions(self, request):
+        for permission in self.get_permissions():
+            if not permission.has_permission(request, self):
+                self.permission_denied(request, getattr(permission, 'message', None))
+
+    def check_object_permissions(self, request, obj):
+        for permission in self.get_permissions():
+            if not permission.has_object_permission(request, self, obj):
+                self.permission_denied(request, getattr(permission, 'message', None))
+
+    def permission_denied(self, request, message=None):
+        if not request.user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+        raise exceptions.PermissionDenied(detail=message)
+
+    def get_field_selection(self):
+        if not hasattr(self, '_field_selection'):
+            self._field_selection = parse_field_selection(self.request)
+        return self._field_selection
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'format': None, 'view': self}
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', self.get_serializer_context())
+        return apply_field_selection(self.serializer_class(*args, **kwargs), self.get_field_selection())
+
+    def handle_exception(self, exc):
+        response = exception_handler(exc, {'view': self, 'request': self.request})
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response['WWW-Authenticate'] = self.www_authenticate
+        return response
+
+    def finalize_response(self, response):
+        # Render here: a deferred-rendering Response would be rendered by the
+        # handler through sync_to_async, costing a thread hop per request.
+        if isinstance(response, Response):
+            content = self.renderer.render(response.data, self.renderer.media_type, {'response': response})
+            rendered = HttpResponse(content, status=response.status_code, content_type='application/json')
+            for header, value in response.items():
+                if header.lower() != 'content-type':
+                    rendered[header] = value
+            response = rendered
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+
+class AsyncListView(AsyncAPIView):
+    """Filtered, paginated list of ``queryset`` through ``serializer_class``."""
+
+    queryset = None
+    serializer_class = None
+    filter_backends = []
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+    keyset_ordering = None
+
+    def get_serializer_class(self):
+        return self.serializer_class
+
+    def get_queryset(self):
+        plan = get_query_plan(self.serializer_class, self.get_serializer_context(), self.get_field_selection())
+        return plan.apply(self.queryset.all(), columns=[name.lstrip('-') for name in self.keyset_ordering or ()])
+
+    def filter_queryset(self, queryset):
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(self.request, queryset, self)
+        return queryset
+
+    async def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(queryset, request, self)
+        rows = [row async for row in queryset] if page is None else page
+        with measure_serialization():
+            data = self.get_serializer(rows, many=True).data
+        if page is None:
+            return Response(data)
+        return paginator.get_paginated_response(data)
+
+
+class AsyncBlogFilterSet(django_filters.FilterSet):
+    # the sync BlogViewSet validates author and sub_categories with a
+    # ModelChoiceFilter, which queries the database while cleaning the form
+    author = django_filters.NumberFilter(field_name='author')
+    sub_categories = django_filters.NumberFilter(field_name='sub_categories')
+
+    class Meta:
+        model = Blog
+        fields = ['status', 'author', 'sub_categories']
+
+
+class AsyncBlogListView(AsyncListView):
+    queryset = Blog.objects.all()
+    serializer_class = BlogListSerializer
+    filter_backends = [django_filters.DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
+    filterset_class = AsyncBlogFilterSet
+    search_fields = ['title', 'body']
+    ordering_fields = ['id', 'created_at', 'updated_at']
+    keyset_ordering = ('created_at', 'id')
+
+
+class AsyncBlogDetailView(AsyncAPIView):
+    queryset = Blog.objects.all()
+    serializer_class = BlogDetailSerializer
+    validator_field = 'activity_at'
+
+    async def get(self, request, pk):
+        changed_at = await self.queryset.filter(pk=pk).values_list(self.validator_field, flat=True).afirst()
+        etag, last_modified = make_validator(request, Blog, pk, changed_at, self.renderer.media_type)
+        if etag is None:
+            raise Http404
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = Response(await self.retrieve(request, pk))
+        return patch_validator_headers(response, etag, last_modified)
+
+    async def retrieve(self, request, pk):
+        context = self.get_serializer_context()
+        plan = get_query_plan(self.serializer_class, context, self.get_field_selection())
+        try:
+            blog = await plan.apply(self.queryset.all()).aget(pk=pk)
+        except Blog.DoesNotExist:
+            raise Http404
+        self.check_object_permissions(request, blog)
+
+        serializer = self.get_serializer(blog, context=context)
+        context['related_pages'] = {
+            name: [row async for row in field.get_queryset(blog)]
+            for name, field in serializer.fields.items()
+            if isinstance(field, RelatedPageField)
+        }
+        with measure_serialization():
+            return serializer.data
+
+
+class AsyncCategoryListView(AsyncListView):
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+
+
+class AsyncMeView(AsyncAPIView):
+
+    async def get(self, request):
+        serializer = CustomUserSerializer(request.user, context=self.get_serializer_context())
+        with measure_serialization():
+            return Response(serializer.data)
@@ -0,0 +1,148 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+DEFAULTS = {
+    # entries kept by the in-process cache, least recently used go first
+    'MAX_SIZE': 10000,
+    # seconds a resolved token is trusted without going back to the database
+    'TTL': 300,
+    # alias in CACHES to share entries between processes, instead of
+    # keeping them in process memory
+    'CACHE_ALIAS': None,
+}
+
+KEY_PREFIX = 'api:token:'
+
+
+def get_setting(name):
+    return getattr(settings, 'TOKEN_AUTH_CACHE', {}).get(name, DEFAULTS[name])
+
+
+class LRUCache:
+    """Thread-safe mapping of at most ``max_size`` entries that expire ``ttl`` seconds after they are stored."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache():
+    global _local_cache
+    if _local_cache is None:
+        with _local_cache_lock:
+            if _local_cache is None:
+                _local_cache = LRUCache(get_setting('MAX_SIZE'), get_setting('TTL'))
+    return _local_cache
+
+
+def _get_local_token(key):
+    token = get_local_cache().get(key)
+    if token is None:
+        return None
+    # every request gets its own instances; the cached ones stay untouched
+    user = copy.copy(token.user)
+    token = copy.copy(token)
+    token.user = user
+    return token
+
+
+def get_cached_token(key):
+    """The Token for ``key`` with its user loaded, if cached, else None."""
+    alias = get_setting('CACHE_ALIAS')
+    if alias:
+        return caches[alias].get(KEY_PREFIX + key)
+    return _get_local_token(key)
+
+
+async def aget_cached_token(key):
+    # the in-process cache never blocks, a shared one may be over the network
+    alias = get_setting('CACHE_ALIAS')
+    if alias:
+        return await caches[alias].aget(KEY_PREFIX + key)
+    return _get_local_token(key)
+
+
+def cache_token(token):
+    alias = get_setting('CACHE_ALIAS')
+    if alias:
+        caches[alias].set(KEY_PREFIX + token.key, token, get_setting('TTL'))
+    else:
+        get_local_cache().set(token.key, token)
+
+
+async def acache_token(token):
+    alias = get_setting('CACHE_ALIAS')
+    if alias:
+        await caches[alias].aset(KEY_PREFIX + token.key, token, get_setting('TTL'))
+    else:
+        get_local_cache().set(token.key, token)
+
+
+def forget_token(key):
+    alias = get_setting('CACHE_ALIAS')
+    if alias:
+        caches[alias].delete(KEY_PREFIX + key)
+    else:
+        get_local_cache().delete(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that remembers resolved tokens, so most requests
+    skip the Token/CustomUser query. Entries are dropped by api.signals when
+    the token is deleted or regenerated and when its user is saved (which
+    covers deactivation and CustomUserUpdateSerializer), right away and
+    again once the change commits. With the in-process
+    cache other processes only see such changes once ``TTL`` has passed;
+    set ``CACHE_ALIAS`` to share entries and invalidations between them.
+    """
+
+    def authenticate_credentials(self, key):
+        token = get_cached_token(key)
+        if token is not None:
+            return token.user, token
+        user, token = super().authenticate_credentials(key)
+        cache_token(token)
+        return user, token
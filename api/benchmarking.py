@@ -0,0 +1,102 @@
+"""
+Helpers shared by the API benchmark commands: a throwaway test database,
+a reproducible dataset and the list of requests that exercise every
+endpoint of the router.
+"""
+import statistics
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from blog import seed as seed_data
+from blog.models import CustomUser
+
+
+@contextmanager
+def temporary_database():
+    """Run the block against a freshly migrated test database that is dropped afterwards."""
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def seed_dataset(users=200, blogs=1000, comments_per_blog=10, points_per_blog=5, seed=0):
+    """Generate a dataset with blog.seed and return the API token of its first user."""
+    seed_data.generate(
+        users=users, blogs=blogs, comments_per_blog=comments_per_blog, points_per_blog=points_per_blog, seed=seed,
+    )
+    return Token.objects.create(user=CustomUser.objects.order_by('pk').first()).key
+
+
+def _sample(model):
+    queryset = model._default_manager.order_by('pk')
+    count = queryset.count()
+    return queryset[count // 2] if count else None
+
+
+def _filter_value(obj, name):
+    field = obj._meta.get_field(name)
+    if field.many_to_many:
+        related = getattr(obj, name).order_by('pk').first()
+        return related.pk if related else None
+    value = getattr(obj, field.attname)
+    if isinstance(value, bool):
+        return str(value).lower()
+    return value
+
+
+def endpoint_cases(router):
+    """
+    ``(name, url)`` for every GET endpoint of ``router``: list, detail, one
+    filtered list per filterset field, a search, an ordering, a keyset page
+    and each extra action.
+    """
+    cases = []
+    for prefix, viewset, basename in router.registry:
+        list_url = reverse(f'{basename}-list')
+        cases.append((f'{prefix} list', list_url))
+
+        obj = _sample(viewset.queryset.model)
+        if obj is None:
+            continue
+        cases.append((f'{prefix} detail', reverse(f'{basename}-detail', kwargs={'pk': obj.pk})))
+
+        for name in getattr(viewset, 'filterset_fields', None) or []:
+            value = _filter_value(obj, name)
+            if value is not None:
+                cases.append((f'{prefix} filter {name}', f'{list_url}?{name}={value}'))
+        search_fields = getattr(viewset, 'search_fields', None)
+        if search_fields:
+            term = str(getattr(obj, search_fields[0])).split()[0]
+            cases.append((f'{prefix} search', f'{list_url}?search={term}'))
+        ordering_fields = getattr(viewset, 'ordering_fields', None)
+        if ordering_fields and ordering_fields != '__all__':
+            cases.append((f'{prefix} ordering', f'{list_url}?ordering=-{ordering_fields[-1]}'))
+        if getattr(viewset, 'keyset_ordering', None):
+            cases.append((f'{prefix} keyset', f'{list_url}?pagination=keyset'))
+
+        for extra in viewset.get_extra_actions():
+            if 'get' not in extra.mapping:
+                continue
+            if extra.detail:
+                url = reverse(f'{basename}-{extra.url_name}', kwargs={'pk': obj.pk})
+            else:
+                url = reverse(f'{basename}-{extra.url_name}')
+            cases.append((f'{prefix} {extra.url_path}', url))
+    return cases
+
+
+def percentiles(values, *points):
+    """Values at the given percentiles, in milliseconds."""
+    if len(values) < 2:
+        return [values[0] * 1000 if values else 0.0 for _ in points]
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return [cuts[point - 1] * 1000 for point in points]
@@ -0,0 +1,228 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import exceptions, serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueTogetherValidator
+
+from .serializers import PreloadedHyperlinkedRelatedField, hyperlink_pk
+
+
+def preload_related_objects(serializer, items):
+    """
+    Load every object the hyperlinks in ``items`` point to with one
+    in_bulk() query per related field, keyed the way
+    PreloadedHyperlinkedRelatedField expects them in the context.
+    """
+    fields = [
+        field for field in serializer.fields.values()
+        if isinstance(field, PreloadedHyperlinkedRelatedField) and not field.read_only
+    ]
+    pks = defaultdict(set)
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        for field in fields:
+            pk = field.lookup_value(item.get(field.field_name))
+            if pk is not None:
+                pks[field.field_name].add(pk)
+    return {
+        field.field_name: field.get_queryset().in_bulk(pks[field.field_name])
+        for field in fields
+    }
+
+
+def bulk_response(items, done, errors, done_status, done_key):
+    """
+    The per-item outcome of a batch: ``done`` maps item indexes to their
+    data, ``errors`` to a ``(status, errors)`` pair. The response is
+    ``done_status`` if every item succeeded, 207 if only some did, and the
+    status all the failures share (400 when they differ) if none did.
+    """
+    results = [None] * len(items)
+    for index, data in done.items():
+        results[index] = {'index': index, 'status': done_status, 'data': data}
+    for index, (error_status, error) in errors.items():
+        results[index] = {'index': index, 'status': error_status, 'errors': error}
+
+    if not errors:
+        response_status = done_status
+    elif done:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        statuses = {error_status for error_status, _ in errors.values()}
+        response_status = statuses.pop() if len(statuses) == 1 else status.HTTP_400_BAD_REQUEST
+    return Response({done_key: len(done), 'failed': len(errors), 'results': results}, status=response_status)
+
+
+class BulkMixin:
+    """
+    ``POST <list>/bulk/`` with a JSON array of up to ``bulk_max_items``
+    objects creates them, ``PATCH`` with objects that each carry their
+    ``url`` updates the fields they send. Hyperlinks are resolved and rows
+    are loaded for the whole batch at once, every item is validated on its
+    own, and the valid ones are written by ``perform_bulk_create`` or
+    ``perform_bulk_update``. The response lists the outcome of each item:
+    201 (200 for updates) if all succeeded, 207 if only some did, and the
+    failures' status otherwise.
+    """
+
+    bulk_max_items = 500
+
+    def get_bulk_items(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise serializers.ValidationError({'non_field_errors': ['expected a non-empty list of items.']})
+        if len(items) > self.bulk_max_items:
+            raise serializers.ValidationError(
+                {'non_field_errors': [f'at most {self.bulk_max_items} items can be sent at once.']}
+            )
+        return items
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        items = self.get_bulk_items(request)
+
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        context['related_objects'] = preload_related_objects(serializer_class(context=context), items)
+
+        # unique together constraints are checked for the whole batch at once
+        validators = serializer_class(context=context).validators
+        unique_together = [validator for validator in validators if isinstance(validator, UniqueTogetherValidator)]
+        validators = [validator for validator in validators if validator not in unique_together]
+
+        valid, errors = [], {}
+        for index, item in enumerate(items):
+            serializer = serializer_class(data=item, context=context)
+            serializer.validators = validators
+            if serializer.is_valid():
+                valid.append((index, serializer))
+            else:
+                errors[index] = (status.HTTP_400_BAD_REQUEST, serializer.errors)
+        for validator in unique_together:
+            valid = self.check_unique_together(validator, valid, errors)
+
+        instances = []
+        if valid:
+            model = serializer_class.Meta.model
+            instances = self.perform_bulk_create([model(**serializer.validated_data) for _, serializer in valid])
+        data = serializer_class(instances, many=True, context=context).data
+        done = {index: item for (index, _), item in zip(valid, data)}
+        return bulk_response(items, done, errors, status.HTTP_201_CREATED, 'created')
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        items = self.get_bulk_items(request)
+
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        serializer = serializer_class(context=context)
+        model = serializer_class.Meta.model
+        url_name = api_settings.URL_FIELD_NAME
+        url_field = serializer.fields[url_name]
+
+        errors, pks, seen = {}, {}, set()
+        for index, item in enumerate(items):
+            url = item.get(url_name) if isinstance(item, dict) else None
+            pk = hyperlink_pk(url, url_field.view_name, url_field.lookup_url_kwarg, model)
+            if pk is None:
+                errors[index] = (status.HTTP_400_BAD_REQUEST, {url_name: ['a link to the object is required.']})
+            elif pk in seen:
+                errors[index] = (status.HTTP_400_BAD_REQUEST, {url_name: ['sent more than once.']})
+            else:
+                pks[index] = pk
+                seen.add(pk)
+
+        context['related_objects'] = preload_related_objects(serializer, items)
+        # validation reads the current related objects, joined in here
+        related = [
+            field.source for field in serializer.fields.values()
+            if isinstance(field, PreloadedHyperlinkedRelatedField) and not field.read_only
+        ]
+        instances = self.get_queryset().select_related(*related).in_bulk(pks.values())
+
+        valid = []
+        for index, pk in pks.items():
+            instance = instances.get(pk)
+            if instance is None:
+                errors[index] = (status.HTTP_404_NOT_FOUND, {'detail': 'Not found.'})
+                continue
+            try:
+                self.check_object_permissions(request, instance)
+            except exceptions.APIException as exc:
+                errors[index] = (exc.status_code, {'detail': exc.detail})
+                continue
+            serializer = serializer_class(instance, data=items[index], partial=True, context=context)
+            # unique together constraints are checked against the stored rows,
+            # one query per item that sends one of their fields
+            serializer.validators = [
+                validator for validator in serializer.validators
+                if not isinstance(validator, UniqueTogetherValidator)
+                or any(name in items[index] for name in validator.fields)
+            ]
+            if serializer.is_valid():
+                valid.append((index, serializer))
+            else:
+                errors[index] = (status.HTTP_400_BAD_REQUEST, serializer.errors)
+
+        updated = []
+        fields = set()
+        for _, serializer in valid:
+            for name, value in serializer.validated_data.items():
+                setattr(serializer.instance, name, value)
+                fields.add(name)
+            updated.append(serializer.instance)
+        if updated and fields:
+            self.perform_bulk_update(updated, sorted(fields))
+        data = serializer_class(updated, many=True, context=context).data
+        done = {index: item for (index, _), item in zip(valid, data)}
+        return bulk_response(items, done, errors, status.HTTP_200_OK, 'updated')
+
+    def check_unique_together(self, validator, valid, errors):
+        """Drop the items that clash with a stored row or an earlier item, in one query."""
+        if not valid:
+            return valid
+        fields = validator.fields
+        keys = [
+            tuple(getattr(serializer.validated_data[name], 'pk', serializer.validated_data[name]) for name in fields)
+            for _, serializer in valid
+        ]
+        condition = Q()
+        for key in set(keys):
+            condition |= Q(**dict(zip(fields, key)))
+        taken = set(validator.queryset.filter(condition).values_list(*fields))
+
+        message = validator.message.format(field_names=', '.join(fields))
+        remaining = []
+        for (index, serializer), key in zip(valid, keys):
+            if key in taken:
+                errors[index] = (status.HTTP_400_BAD_REQUEST, {'non_field_errors': [message]})
+            else:
+                taken.add(key)
+                remaining.append((index, serializer))
+        return remaining
+
+    def perform_bulk_create(self, instances):
+        """
+        Save the unsaved ``instances`` and return them. Each one goes through
+        save() and the signals; viewsets override this with a set-based
+        insert where one exists.
+        """
+        with transaction.atomic():
+            for instance in instances:
+                instance.save()
+        return instances
+
+    def perform_bulk_update(self, instances, fields):
+        """
+        Write ``fields`` of the changed ``instances``. Each one goes through
+        save() and the signals; viewsets override this with a bulk_update()
+        where one exists.
+        """
+        with transaction.atomic():
+            for instance in instances:
+                instance.save(update_fields=fields)
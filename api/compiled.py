@@ -0,0 +1,245 @@
+"""
+Read-only serialization of list pages straight from ``.values()`` rows.
+
+A serializer class is compiled once into one getter per field. Hyperlinks
+come from URL templates reversed once per request instead of once per
+row and field, and many-to-many hyperlinks from one extra query per page.
+The output is the same as the serializer's own. Serializers with fields
+that need model instances (methods, properties, nested serializers,
+reverse relations) are not compiled and keep the regular path.
+
+Compiled serializers are cached per class and field selection, so they
+hold no request: fields that render through ``to_representation`` are
+bound to the current request's context once per page.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+from rest_framework import relations, serializers
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from config.metrics import measure_serialization
+
+from .mixins import MAX_CACHED_PLANS, apply_field_selection, get_query_plan
+
+# stands in for the primary key while a URL template is reversed
+PK_PLACEHOLDER = 9081726354
+
+
+class Unsupported(Exception):
+    pass
+
+
+class CompiledSerializer:
+    def __init__(self, serializer_class, selection=None):
+        serializer = apply_field_selection(serializer_class(), selection)
+        self.serializer_class = serializer_class
+        self.model = serializer.Meta.model
+        self.fields = []
+        self.columns = []
+        self.optional = set()
+        self.many_related = {}
+        for name, field in serializer.fields.items():
+            if not field.write_only:
+                self.fields.append(self.compile_field(name, field))
+
+    def compile_field(self, name, field):
+        opts = self.model._meta
+        if isinstance(field, relations.HyperlinkedIdentityField):
+            self._check_lookup(field)
+            self.columns.append(opts.pk.name)
+            return name, 'link', (opts.pk.name, field.view_name, field.format)
+
+        if field.source == '*' or len(field.source_attrs) != 1:
+            raise Unsupported(name)
+        source = field.source_attrs[0]
+        try:
+            model_field = opts.get_field(source)
+        except FieldDoesNotExist:
+            if hasattr(self.model, source) or not field.read_only:
+                raise Unsupported(name)
+            # an annotation such as search_rank, skipped on rows that lack it
+            self.optional.add(source)
+            return name, 'annotation', (source,)
+
+        if isinstance(field, relations.ManyRelatedField):
+            child = field.child_relation
+            if not isinstance(child, relations.HyperlinkedRelatedField) or not model_field.many_to_many:
+                raise Unsupported(name)
+            if model_field.auto_created:
+                raise Unsupported(name)
+            self._check_lookup(child)
+            self.columns.append(opts.pk.name)
+            self.many_related[source] = model_field
+            return name, 'many_links', (source, child.view_name, child.format)
+        if isinstance(field, relations.HyperlinkedRelatedField):
+            if not model_field.concrete or not model_field.many_to_one and not model_field.one_to_one:
+                raise Unsupported(name)
+            self._check_lookup(field)
+            self.columns.append(source)
+            return name, 'link', (source, field.view_name, field.format)
+        if isinstance(field, (serializers.BaseSerializer, relations.RelatedField)) or not model_field.concrete:
+            raise Unsupported(name)
+
+        self.columns.append(source)
+        if isinstance(model_field, models.FileField):
+            return name, 'file', (source, model_field.storage, getattr(field, 'use_url', True))
+        # fields with their own descriptor (django-countries, for one) read
+        # differently from an instance than from .values()
+        if type(getattr(self.model, model_field.attname, None)) is not DeferredAttribute:
+            raise Unsupported(name)
+        return name, 'value', (source,)
+
+    @staticmethod
+    def _check_lookup(field):
+        if field.lookup_field != 'pk' or field.lookup_url_kwarg != 'pk':
+            raise Unsupported(field.field_name)
+
+    def values(self, queryset, extra=()):
+        """``queryset`` as dict rows holding every column the fields read, plus ``extra``."""
+        query = queryset.query
+        present = set(query.extra_select) | set(query.annotation_select)
+        names = list(dict.fromkeys([*self.columns, *extra, *(name for name in self.optional if name in present)]))
+        return queryset.prefetch_related(None).values(*names)
+
+    def serialize(self, rows, context):
+        rows = list(rows)
+        request = context['request']
+        request_format = context.get('format')
+        templates = {}
+
+        def template(view_name, field_format):
+            # HyperlinkedRelatedField prefers its own format over the request's
+            link_format = request_format
+            if request_format and field_format and field_format != request_format:
+                link_format = field_format
+            key = (view_name, link_format)
+            if key not in templates:
+                url = reverse(view_name, kwargs={'pk': PK_PLACEHOLDER}, request=request, format=link_format)
+                templates[key] = url.split(str(PK_PLACEHOLDER), 1)
+            return templates[key]
+
+        many_values = {source: self._many_values(source, rows) for source in self.many_related}
+        # fields such as ImageDerivativesField read the request from their context
+        bound_fields = None
+
+        getters = []
+        for name, kind, args in self.fields:
+            if kind == 'link':
+                getters.append((name, self._link_getter(args[0], *template(*args[1:]))))
+            elif kind == 'many_links':
+                getters.append((name, self._many_links_getter(many_values[args[0]], *template(*args[1:]))))
+            elif kind == 'file':
+                getters.append((name, self._file_getter(*args, request)))
+            else:
+                if kind == 'annotation' and rows and args[0] not in rows[0]:
+                    continue
+                if bound_fields is None:
+                    bound_fields = self.serializer_class(context=context).fields
+                getters.append((name, self._value_getter(args[0], bound_fields[name].to_representation)))
+
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+    def _many_values(self, source, rows):
+        # the same join the prefetch_related() of the regular path runs, so
+        # the related rows come back in the same order
+        model_field = self.many_related[source]
+        related_name = model_field.related_query_name()
+        pks = [row[self.model._meta.pk.name] for row in rows]
+        grouped = {pk: [] for pk in pks}
+        if pks:
+            queryset = model_field.related_model._default_manager.filter(**{f'{related_name}__in': pks})
+            for owner, related in queryset.values_list(related_name, 'pk'):
+                grouped[owner].append(related)
+        return grouped
+
+    @staticmethod
+    def _link_getter(column, prefix, suffix):
+        def get(row):
+            value = row[column]
+            return None if value is None else f'{prefix}{value}{suffix}'
+        return get
+
+    def _many_links_getter(self, grouped, prefix, suffix):
+        pk_name = self.model._meta.pk.name
+
+        def get(row):
+            return [f'{prefix}{value}{suffix}' for value in grouped[row[pk_name]]]
+        return get
+
+    @staticmethod
+    def _file_getter(column, storage, use_url, request):
+        def get(row):
+            name = row[column]
+            if not name:
+                return None
+            if not use_url:
+                return name
+            return request.build_absolute_uri(storage.url(name))
+        return get
+
+    @staticmethod
+    def _value_getter(column, to_representation):
+        def get(row):
+            value = row[column]
+            return None if value is None else to_representation(value)
+        return get
+
+
+_compiled = {}
+
+
+def get_compiled_serializer(serializer_class, selection=None):
+    """The compiled form of ``serializer_class``, or None when it cannot be compiled."""
+    key = (serializer_class, selection)
+    if key not in _compiled:
+        try:
+            compiled = CompiledSerializer(serializer_class, selection)
+        except Unsupported:
+            compiled = None
+        if selection is None or len(_compiled) < MAX_CACHED_PLANS:
+            _compiled[key] = compiled
+        return compiled
+    return _compiled[key]
+
+
+class CompiledListMixin:
+    """
+    Serves list pages, and the related lists of ``paginated_related_response``,
+    through the compiled serializer when the serializer class allows it.
+    """
+
+    compiled_list = True
+
+    def get_compiled_serializer(self, serializer_class):
+        if not self.compiled_list or self.request is None:
+            return None
+        return get_compiled_serializer(serializer_class, self.get_field_selection())
+
+    def compiled_list_response(self, queryset, compiled, context, ordering=()):
+        # keyset cursors are read from the rows
+        rows = compiled.values(queryset, extra=[name.lstrip('-') for name in ordering])
+        page = self.paginate_queryset(rows)
+        with measure_serialization():
+            data = compiled.serialize(rows if page is None else page, context)
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def list(self, request, *args, **kwargs):
+        compiled = self.get_compiled_serializer(self.get_serializer_class())
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = getattr(self, 'keyset_ordering', None) or ()
+        return self.compiled_list_response(queryset, compiled, self.get_serializer_context(), ordering)
+
+    def paginated_related_response(self, queryset, serializer_class, ordering):
+        compiled = self.get_compiled_serializer(serializer_class)
+        if compiled is None:
+            return super().paginated_related_response(queryset, serializer_class, ordering)
+        context = self.get_serializer_context()
+        plan = get_query_plan(serializer_class, context, self.get_field_selection())
+        queryset = plan.apply(queryset).order_by(*ordering)
+        return self.compiled_list_response(queryset, compiled, context, ordering)
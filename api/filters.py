@@ -0,0 +1,20 @@
+from rest_framework import filters
+
+from blog import search
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    SearchFilter backed by the blog FTS5 index. Results are ordered by
+    relevance and carry ``search_rank`` and ``search_snippet``. Falls back
+    to the regular icontains search when the index is not available.
+    """
+
+    highlight = ('<mark>', '</mark>')
+    snippet_tokens = 16
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not search.is_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        return search.search(queryset, terms, highlight=self.highlight, snippet_tokens=self.snippet_tokens)
@@ -0,0 +1,129 @@
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from api.benchmarking import endpoint_cases, percentiles, seed_dataset, temporary_database
+from api.urls import router
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and time every GET endpoint of the API router, reporting '
+        'p50/p95/p99 latency, queries per request and response size. Results are written as JSON '
+        'so runs can be compared between commits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--blogs', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=10, help='Comments per blog.')
+        parser.add_argument('--points', type=int, default=5, help='Points per blog.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per endpoint.')
+        parser.add_argument('--match', help='Only run endpoints whose name contains this text.')
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--compare', help='Earlier results file to compare against.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as file:
+                    baseline = {result['name']: result for result in json.load(file)['results']}
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError(f'Could not read {options["compare"]}: {error}')
+
+        dataset = {name: options[name] for name in ('users', 'blogs', 'comments', 'points', 'seed')}
+        with temporary_database():
+            started = time.perf_counter()
+            token = seed_dataset(
+                users=options['users'], blogs=options['blogs'], comments_per_blog=options['comments'],
+                points_per_blog=options['points'], seed=options['seed'],
+            )
+            self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+            cases = endpoint_cases(router) + [('me', '/api/me/')]
+            if options['match']:
+                cases = [case for case in cases if options['match'] in case[0]]
+            client = Client(headers={'Authorization': f'Token {token}'})
+            results = [self.measure(client, name, url, options) for name, url in cases]
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'dataset': dataset,
+                'iterations': options['iterations'],
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as file:
+            json.dump(report, file, indent=2)
+
+        self.print_table(results, baseline)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+    def measure(self, client, name, url, options):
+        for _ in range(options['warmup']):
+            client.get(url)
+
+        latencies, query_counts, query_times = [], [], []
+        for _ in range(max(1, options['iterations'])):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                latencies.append(time.perf_counter() - started)
+            query_counts.append(len(queries.captured_queries))
+            query_times.append(sum(float(query['time']) for query in queries.captured_queries))
+
+        p50, p95, p99 = percentiles(latencies, 50, 95, 99)
+        return {
+            'name': name,
+            'url': url,
+            'status': response.status_code,
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+            'queries': max(query_counts),
+            'query_ms': round(1000 * sum(query_times) / len(query_times), 2),
+            'bytes': len(response.content),
+        }
+
+    def print_table(self, results, baseline):
+        self.stdout.write(
+            f'{"endpoint":<36}{"status":>7}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"bytes":>10}'
+        )
+        for result in results:
+            line = (
+                f'{result["name"]:<36}{result["status"]:>7}{result["p50_ms"]:>9.1f}{result["p95_ms"]:>9.1f}'
+                f'{result["p99_ms"]:>9.1f}{result["queries"]:>9}{result["bytes"]:>10}'
+            )
+            previous = (baseline or {}).get(result['name'])
+            if previous:
+                line += (
+                    f'   p95 {result["p95_ms"] - previous["p95_ms"]:+.1f} ms,'
+                    f' queries {result["queries"] - previous["queries"]:+d}'
+                )
+            self.stdout.write(line)
@@ -0,0 +1,101 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+
+from api.benchmarking import seed_dataset, temporary_database
+from blog.models import Blog
+
+# endpoint -> (sync viewset path, async view path)
+ENDPOINTS = {
+    'blog list': ('/api/blogs/', '/api/async/blogs/'),
+    'blog detail': ('/api/blogs/{blog}/', '/api/async/blogs/{blog}/'),
+    'category tree': ('/api/categories/', '/api/async/categories/'),
+    'me': ('/api/me/', '/api/async/me/'),
+}
+
+
+def summarize(latencies, statuses, elapsed):
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': cuts[49] * 1000,
+        'p95': cuts[94] * 1000,
+        'errors': sum(status != 200 for status in statuses),
+    }
+
+
+def run_wsgi(path, headers, requests, concurrency):
+    local = threading.local()
+
+    def fetch(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client(headers=headers)
+        start = time.perf_counter()
+        response = client.get(path)
+        return time.perf_counter() - start, response.status_code
+
+    fetch(None)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - start
+    return summarize([latency for latency, _ in results], [status for _, status in results], elapsed)
+
+
+async def run_asgi(path, headers, requests, concurrency):
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            return time.perf_counter() - start, response.status_code
+
+    await fetch()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(fetch() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    return summarize([latency for latency, _ in results], [status for _, status in results], elapsed)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare read throughput of the API served through WSGI, the sync views under ASGI and the '
+        'native async views, in process against a seeded throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and mode.')
+        parser.add_argument('--concurrency', type=int, default=64, help='Requests in flight at once.')
+        parser.add_argument('--blogs', type=int, default=200, help='Blogs to seed.')
+        parser.add_argument('--endpoint', action='append', choices=sorted(ENDPOINTS), help='Only benchmark these endpoints.')
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            token = seed_dataset(users=50, blogs=options['blogs'], comments_per_blog=5)
+            blog = Blog.objects.order_by('pk').values_list('pk', flat=True).first()
+            self.benchmark(options, {'Authorization': f'Token {token}'}, blog)
+
+    def benchmark(self, options, headers, blog):
+        requests, concurrency = options['requests'], options['concurrency']
+        self.stdout.write(f'{requests} requests per run, {concurrency} concurrent\n')
+        self.stdout.write(f'{"endpoint":<16}{"mode":<12}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+        for name in options['endpoint'] or ENDPOINTS:
+            sync_path, async_path = (path.format(blog=blog) for path in ENDPOINTS[name])
+            runs = [
+                ('wsgi', run_wsgi(sync_path, headers, requests, concurrency)),
+                ('asgi sync', asyncio.run(run_asgi(sync_path, headers, requests, concurrency))),
+                ('asgi async', asyncio.run(run_asgi(async_path, headers, requests, concurrency))),
+            ]
+            for mode, result in runs:
+                self.stdout.write(
+                    f'{name:<16}{mode:<12}{result["rps"]:>10.1f}{result["p50"]:>10.1f}'
+                    f'{result["p95"]:>10.1f}{result["errors"]:>8}'
+                )
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarking import percentiles, seed_dataset, temporary_database
+from api.compiled import get_compiled_serializer
+from api.mixins import get_query_plan
+from api.serializers import BlogListSerializer, CommentSerializer, PointSerializer
+from blog.models import Blog, Comment, Point
+
+# name -> (serializer class, queryset, ordering)
+CASES = {
+    'blog list': (BlogListSerializer, Blog.objects.all(), ('created_at', 'id')),
+    'comment list': (CommentSerializer, Comment.objects.all(), ('created_at', 'id')),
+    'point list': (PointSerializer, Point.objects.all(), ('id',)),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Time one list page through the regular serializers and through the compiled values() path '
+        '(query, serialization and JSON rendering), after checking both render the same bytes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blogs', type=int, default=500)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with temporary_database():
+            seed_dataset(users=200, blogs=options['blogs'])
+            request = Request(APIRequestFactory().get('/api/'))
+            context = {'request': request, 'format': None, 'view': None}
+            renderer = JSONRenderer()
+
+            self.stdout.write(f'{"serializer":<16}{"regular p50":>13}{"compiled p50":>14}{"speedup":>9}')
+            for name, (serializer_class, queryset, ordering) in CASES.items():
+                compiled = get_compiled_serializer(serializer_class)
+                if compiled is None:
+                    raise CommandError(f'{serializer_class.__name__} cannot be compiled.')
+                plan = get_query_plan(serializer_class, context)
+                page = plan.apply(queryset).order_by(*ordering)[:options['page_size']]
+
+                def regular():
+                    return renderer.render(serializer_class(list(page), many=True, context=context).data)
+
+                def fast():
+                    return renderer.render(compiled.serialize(compiled.values(page), context))
+
+                if regular() != fast():
+                    raise CommandError(f'{name}: the compiled output differs from the serializer output.')
+                regular_ms = self.measure(regular, options['iterations'])
+                fast_ms = self.measure(fast, options['iterations'])
+                self.stdout.write(f'{name:<16}{regular_ms:>11.2f}ms{fast_ms:>12.2f}ms{regular_ms / fast_ms:>8.1f}x')
+
+    def measure(self, func, iterations):
+        timings = []
+        for _ in range(max(1, iterations)):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return percentiles(timings, 50)[0]
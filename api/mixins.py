@@ -0,0 +1,289 @@
+import hashlib
+from collections import namedtuple
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework import serializers, relations
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+from config.metrics import measure_serialization
+
+
+class QueryPlan:
+    """select_related/prefetch_related/only() plan derived from a serializer's fields."""
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = {model._meta.pk.name}
+        self.select_related = []
+        self.prefetches = []
+        self.restrict_columns = True
+
+    def add_column(self, name):
+        self.columns.add(name)
+
+    def apply(self, queryset, restrict_columns=True, columns=()):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetches:
+            queryset = queryset.prefetch_related(*[
+                Prefetch(lookup, queryset=plan.apply(plan.model._default_manager.all(), restrict_columns))
+                for lookup, plan in self.prefetches
+            ])
+        if restrict_columns and self.restrict_columns:
+            # ``columns`` are read besides the fields, keyset cursors for one
+            queryset = queryset.only(*sorted(self.columns.union(columns)))
+        return queryset
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def build_query_plan(serializer, model=None):
+    model = model or serializer.Meta.model
+    plan = QueryPlan(model)
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        if field.source == '*':
+            if isinstance(field, relations.HyperlinkedIdentityField):
+                # 'pk' only resolves on the model itself, not through a join
+                plan.add_column(model._meta.pk.name if field.lookup_field == 'pk' else field.lookup_field)
+            else:
+                plan.restrict_columns = False
+            continue
+
+        if len(field.source_attrs) > 1:
+            plan.restrict_columns = False
+            continue
+
+        name = field.source_attrs[0]
+        model_field = _model_field(model, name)
+
+        if model_field is None:
+            # Annotations are not attributes of the model class and need no
+            # column; properties and methods may read any of them.
+            if hasattr(model, name) or isinstance(field, serializers.SerializerMethodField):
+                plan.restrict_columns = False
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            child_plan = build_query_plan(field.child, model_field.related_model)
+            if model_field.one_to_many:
+                child_plan.add_column(model_field.field.name)
+            plan.prefetches.append((name, child_plan))
+        elif isinstance(field, serializers.BaseSerializer):
+            child_plan = build_query_plan(field, model_field.related_model)
+            plan.select_related.append(name)
+            plan.select_related.extend(f'{name}__{lookup}' for lookup in child_plan.select_related)
+            plan.prefetches.extend((f'{name}__{lookup}', nested) for lookup, nested in child_plan.prefetches)
+            plan.add_column(name)
+            if child_plan.restrict_columns:
+                for column in child_plan.columns:
+                    plan.add_column(f'{name}__{column}')
+        elif isinstance(field, relations.ManyRelatedField):
+            child_plan = QueryPlan(model_field.related_model)
+            if not _uses_pk_only(field.child_relation):
+                child_plan.restrict_columns = False
+            plan.prefetches.append((name, child_plan))
+        elif isinstance(field, relations.RelatedField):
+            if model_field.many_to_one or model_field.one_to_one:
+                if model_field.concrete:
+                    plan.add_column(name)
+                if not _uses_pk_only(field) or not model_field.concrete:
+                    plan.select_related.append(name)
+            else:
+                plan.restrict_columns = False
+        elif model_field.concrete:
+            plan.add_column(name)
+        else:
+            plan.restrict_columns = False
+
+    return plan
+
+
+def _uses_pk_only(field):
+    return hasattr(field, 'use_pk_only_optimization') and field.use_pk_only_optimization()
+
+
+# fields kept with ?fields=, dropped with ?omit=, and relations sent as
+# nested objects instead of hyperlinks with ?expand= (the serializer lists
+# the ones it allows, and their serializer, in Meta.expandable_fields)
+FieldSelection = namedtuple('FieldSelection', ['fields', 'omit', 'expand'])
+
+
+def parse_field_selection(request):
+    """The FieldSelection asked for in the query string, or None."""
+    def names(param):
+        value = request.query_params.get(param, '')
+        return frozenset(name.strip() for name in value.split(',') if name.strip()) or None
+
+    fields, omit, expand = names('fields'), names('omit'), names('expand')
+    if fields is None and omit is None and expand is None:
+        return None
+    return FieldSelection(fields, omit, expand)
+
+
+def apply_field_selection(serializer, selection):
+    """
+    Drop the fields of ``serializer``, or of its child for many=True, that
+    ``selection`` leaves out, and nest the relations it expands.
+    """
+    if selection is None:
+        return serializer
+    target = serializer.child if isinstance(serializer, serializers.ListSerializer) else serializer
+    unknown = ((selection.fields or set()) | (selection.omit or set())) - set(target.fields)
+    if unknown:
+        raise ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown))}.'})
+    expandable = getattr(getattr(target, 'Meta', None), 'expandable_fields', {})
+    unknown = (selection.expand or set()) - set(expandable)
+    if unknown:
+        raise ValidationError({'expand': f'Cannot expand: {", ".join(sorted(unknown))}.'})
+    for name in list(target.fields):
+        if selection.fields is not None and name not in selection.fields or name in (selection.omit or ()):
+            del target.fields[name]
+    for name in selection.expand or ():
+        if name in target.fields:
+            many = isinstance(target.fields[name], relations.ManyRelatedField)
+            target.fields[name] = expandable[name](many=many, read_only=True)
+    return serializer
+
+
+_query_plans = {}
+# selections come from the query string, so only this many are cached
+MAX_CACHED_PLANS = 1000
+
+
+def get_query_plan(serializer_class, context=None, selection=None):
+    context = context or {}
+    key = (serializer_class, selection)
+    plan = _query_plans.get(key)
+    if plan is None:
+        plan = build_query_plan(apply_field_selection(serializer_class(context=context), selection))
+        if selection is None or len(_query_plans) < MAX_CACHED_PLANS:
+            _query_plans[key] = plan
+    return plan
+
+
+class QueryPlanMixin:
+    """
+    Derives select_related/prefetch_related/only() from the serializer the
+    action is going to use, so list pages run a constant number of queries.
+    Columns are only restricted on safe methods, writes load full rows.
+    Reads also take ?fields=, ?omit= and ?expand=, which trim or nest the
+    serializer and, through the plan, the columns and joins that are loaded.
+    """
+
+    def get_field_selection(self):
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return None
+        if not hasattr(self, '_field_selection'):
+            self._field_selection = parse_field_selection(self.request)
+        return self._field_selection
+
+    def get_serializer(self, *args, **kwargs):
+        return apply_field_selection(super().get_serializer(*args, **kwargs), self.get_field_selection())
+
+    # the generic actions build the serializer and read its data in one go,
+    # so reads are timed as serializer work as a whole, their SQL left out
+    def list(self, request, *args, **kwargs):
+        with measure_serialization():
+            return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        with measure_serialization():
+            return super().retrieve(request, *args, **kwargs)
+
+    def get_query_plan(self):
+        serializer_class = self.get_serializer_class()
+        if getattr(getattr(serializer_class, 'Meta', None), 'model', None) is not self.queryset.model:
+            return None
+        return get_query_plan(serializer_class, self.get_serializer_context(), self.get_field_selection())
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self, 'swagger_fake_view', False) or self.request is None:
+            return queryset
+        plan = self.get_query_plan()
+        if plan is None:
+            return queryset
+        ordering = []
+        if getattr(self, 'action', 'list') == 'list':
+            ordering = [name.lstrip('-') for name in getattr(self, 'keyset_ordering', None) or ()]
+        return plan.apply(queryset, restrict_columns=self.request.method in SAFE_METHODS, columns=ordering)
+
+    def paginated_related_response(self, queryset, serializer_class, ordering):
+        """List ``queryset`` through the view's paginator with ``serializer_class``."""
+        context = self.get_serializer_context()
+        selection = self.get_field_selection()
+        plan = get_query_plan(serializer_class, context, selection)
+        queryset = plan.apply(queryset, columns=[name.lstrip('-') for name in ordering]).order_by(*ordering)
+        page = self.paginate_queryset(queryset)
+        serializer = apply_field_selection(serializer_class(page, many=True, context=context), selection)
+        with measure_serialization():
+            data = serializer.data
+        return self.get_paginated_response(data)
+
+
+class ConditionalRetrieveMixin:
+    """
+    Answers If-None-Match/If-Modified-Since on retrieve from a single
+    indexed lookup of ``validator_field``, before any serializer runs.
+    Only view-level permissions have been checked when a 304 is returned.
+    """
+
+    validator_field = 'activity_at'
+
+    def get_validator(self, request, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: kwargs[lookup_url_kwarg]}
+        changed_at = self.queryset.filter(**filter_kwargs).values_list(self.validator_field, flat=True).first()
+        return make_validator(
+            request, self.queryset.model, kwargs[lookup_url_kwarg], changed_at, request.accepted_renderer.media_type
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validator(request, **kwargs)
+        if etag is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return patch_validator_headers(response, etag, last_modified)
+
+
+def make_validator(request, model, pk, changed_at, media_type):
+    """``(etag, last_modified)`` of a representation of ``model`` ``pk`` last changed at ``changed_at``."""
+    if changed_at is None:
+        return None, None
+
+    # the representation also depends on the negotiated format, the query
+    # string (field selection) and the host used for hyperlinks
+    variant = '|'.join([
+        model._meta.label,
+        str(pk),
+        changed_at.isoformat(),
+        media_type,
+        request.get_host(),
+        request.META.get('QUERY_STRING', ''),
+    ])
+    etag = '"{}"'.format(hashlib.md5(variant.encode(), usedforsecurity=False).hexdigest())
+    return etag, int(changed_at.timestamp())
+
+
+def patch_validator_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Accept', 'Authorization', 'Cookie'])
+    return response
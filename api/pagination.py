@@ -0,0 +1,218 @@
+import base64
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _row_value(row, name):
+    if isinstance(row, dict):
+        return row[name]
+    return getattr(row, name)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination over a unique ordering such as (created_at, id).
+    Cursors are opaque and no total count is computed, so every page costs
+    the same index range scan no matter how deep the client is.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    ordering = ('created_at', 'id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish(list(self.prepare(queryset, request, view)))
+
+    def prepare(self, queryset, request, view=None):
+        """Sliced queryset for the requested page, one row longer than a page."""
+        self.request = request
+        self.ordering = tuple(getattr(view, 'keyset_ordering', None) or self.ordering)
+        self.model = queryset.model
+        self.base_url = remove_query_param(request.build_absolute_uri(), 'page')
+
+        self.reverse, self.position = self.decode_cursor(request)
+        ordering = [self._invert(name) if self.reverse else name for name in self.ordering]
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self._after(ordering, self.position))
+        return queryset[:self.page_size + 1]
+
+    def finish(self, results):
+        reverse, position = self.reverse, self.position
+        has_following = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.has_next = has_following if not reverse else position is not None
+        self.has_previous = position is not None if not reverse else has_following
+        self.first_position = self._position(results[0]) if results else position
+        self.last_position = self._position(results[-1]) if results else position
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(False, self.last_position))
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(True, self.first_position))
+
+    def encode_cursor(self, reverse, position):
+        payload = {'r': int(reverse), 'p': [self._dump(value) for value in position]}
+        data = json.dumps(payload, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            data = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            payload = json.loads(data)
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = tuple(
+                self.model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, values)
+            )
+            return bool(payload['r']), position
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise ParseError(self.invalid_cursor_message)
+
+    def _position(self, row):
+        return tuple(_row_value(row, name.lstrip('-')) for name in self.ordering)
+
+    @staticmethod
+    def _dump(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def _invert(name):
+        return name[1:] if name.startswith('-') else f'-{name}'
+
+    @staticmethod
+    def _after(ordering, position):
+        # a >= x AND (a > x OR (b >= y AND (b > y OR ...))) keeps the leading
+        # column as an index range instead of a plain OR of tuples.
+        condition = None
+        for name, value in reversed(list(zip(ordering, position))):
+            field = name.lstrip('-')
+            strict, loose = ('lt', 'lte') if name.startswith('-') else ('gt', 'gte')
+            step = Q(**{f'{field}__{strict}': value})
+            if condition is not None:
+                step = Q(**{f'{field}__{loose}': value}) & (step | condition)
+            condition = step
+        return condition
+
+
+def keyset_cursor(row, ordering):
+    """Cursor for the keyset page that starts right after ``row``."""
+    position = tuple(_row_value(row, name.lstrip('-')) for name in ordering)
+    return KeysetPagination().encode_cursor(False, position)
+
+
+class ApiPagination(PageNumberPagination):
+    """
+    Page numbers by default. Views that declare ``keyset_ordering`` can also
+    be read with keyset pagination, either by default (``pagination_mode =
+    'keyset'``) or per request with ``?pagination=keyset`` or a ``cursor``.
+    """
+
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request, view):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(self.order_pages(queryset, view), request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views, reading the page with the async ORM."""
+        self.keyset = None
+        if self.use_keyset(request, view):
+            self.keyset = self.keyset_class()
+            rows = self.keyset.prepare(queryset, request, view)
+            return self.keyset.finish([row async for row in rows])
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(self.order_pages(queryset, view), page_size)
+        # Paginator.count is a cached_property; filling it in keeps page()
+        # from running its own synchronous COUNT query
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [row async for row in self.page.object_list]
+        return list(self.page)
+
+    @staticmethod
+    def order_pages(queryset, view):
+        # OFFSET pages only stay consistent over a fixed order: the keyset
+        # ordering where the view has one, else the primary key
+        if queryset.ordered:
+            return queryset
+        return queryset.order_by(*(getattr(view, 'keyset_ordering', None) or ('pk',)))
+
+    def use_keyset(self, request, view):
+        if not getattr(view, 'keyset_ordering', None):
+            return False
+        if self.keyset_class.cursor_query_param in request.query_params:
+            return True
+        mode = request.query_params.get(self.mode_query_param) or getattr(view, 'pagination_mode', 'page')
+        return mode == 'keyset'
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_next_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_next_link()
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.keyset is not None:
+            return self.keyset.get_previous_link()
+        return super().get_previous_link()
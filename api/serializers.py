@@ -1,11 +1,122 @@
-from django.db.models import Avg
+from urllib import parse
+
 from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.files.storage import default_storage
+from django.urls import Resolver404, get_script_prefix, resolve
+from django.utils.encoding import uri_to_iri
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
 
 from blog.models import (
     CustomUser, Blog, AuthorProfile, ReaderProfile, Category, SubCategory,
     Comment, Point
 )
+from .mixins import get_query_plan
+from .pagination import keyset_cursor
+
+class ImageDerivativesField(serializers.ReadOnlyField):
+    """Absolute URLs of the stored image derivatives, as ``{format: {width: url}}``."""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        storage = default_storage
+
+        def build(name):
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        return {
+            extension: {width: build(name) for width, name in sizes.items()}
+            for extension, sizes in (value or {}).items()
+        }
+
+class RelatedPageField(serializers.Field):
+    """
+    First page of a related collection, with its stored count and a keyset
+    link to the paginated sub-resource that serves the rest.
+    """
+
+    page_size = 10
+
+    def __init__(self, serializer_class, related_name, view_name, count_field, ordering, page_size=None, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.serializer_class = serializer_class
+        self.related_name = related_name
+        self.view_name = view_name
+        self.count_field = count_field
+        self.ordering = ordering
+        self.page_size = page_size or self.page_size
+
+    def get_queryset(self, obj):
+        queryset = getattr(obj, self.related_name).all()
+        queryset = get_query_plan(self.serializer_class, self.context).apply(queryset).order_by(*self.ordering)
+        return queryset[:self.page_size]
+
+    def to_representation(self, obj):
+        # views that already loaded the page (the async views) pass it in
+        # the context under ``related_pages``
+        results = self.context.get('related_pages', {}).get(self.field_name)
+        if results is None:
+            results = list(self.get_queryset(obj))
+        count = getattr(obj, self.count_field)
+
+        next_link = None
+        # the stored count can run ahead of the rows, after drift or when
+        # the page is filtered
+        if results and count > len(results):
+            url = reverse(self.view_name, kwargs={'pk': obj.pk}, request=self.context.get('request'))
+            next_link = replace_query_param(url, 'cursor', keyset_cursor(results[-1], self.ordering))
+
+        return {
+            'count': count,
+            'next': next_link,
+            'results': self.serializer_class(results, many=True, context=self.context).data,
+        }
+
+def hyperlink_pk(data, view_name, lookup_url_kwarg, model):
+    """Primary key of ``model`` the hyperlink ``data`` to ``view_name`` points to, or None if it does not resolve."""
+    if not isinstance(data, str):
+        return None
+    if data.startswith(('http:', 'https:')):
+        data = parse.urlparse(data).path
+        prefix = get_script_prefix()
+        if data.startswith(prefix):
+            data = '/' + data[len(prefix):]
+    try:
+        match = resolve(uri_to_iri(parse.unquote(data)))
+    except Resolver404:
+        return None
+    if match.view_name != view_name or lookup_url_kwarg not in match.kwargs:
+        return None
+    try:
+        return model._meta.pk.to_python(match.kwargs[lookup_url_kwarg])
+    except ValidationError:
+        return None
+
+class PreloadedHyperlinkedRelatedField(serializers.HyperlinkedRelatedField):
+    """
+    HyperlinkedRelatedField that takes its objects from
+    ``context['related_objects'][field_name]`` when the view preloaded them,
+    so validating many items does not cost a query per hyperlink.
+    """
+
+    def lookup_value(self, data):
+        """Primary key the hyperlink ``data`` points to, or None if it does not resolve."""
+        return hyperlink_pk(data, self.view_name, self.lookup_url_kwarg, self.get_queryset().model)
+
+    def get_object(self, view_name, view_args, view_kwargs):
+        objects = self.context.get('related_objects', {}).get(self.field_name)
+        if objects is None:
+            return super().get_object(view_name, view_args, view_kwargs)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(view_kwargs[self.lookup_url_kwarg])
+            return objects[pk]
+        except (KeyError, ValidationError):
+            raise ObjectDoesNotExist
 
 class CustomUserSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
@@ -55,10 +166,7 @@ class CustomUserUpdateSerializer(serializers.HyperlinkedModelSerializer):
         return instance
 
 class AuthorProfileSerializer(serializers.HyperlinkedModelSerializer):
-    blog_count = serializers.SerializerMethodField()
-
-    def get_blog_count(self, obj):
-        return obj.author_blogs.count()
+    profile_image_derivatives = ImageDerivativesField()
 
     class Meta:
         model = AuthorProfile
@@ -82,17 +190,17 @@ class CategorySerializer(serializers.HyperlinkedModelSerializer):
     category_sub_categories = SubCategorySerializer(many=True, read_only=True)
 
 class CommentSerializer(serializers.HyperlinkedModelSerializer):
-    blog = serializers.HyperlinkedRelatedField(
+    blog = PreloadedHyperlinkedRelatedField(
         queryset=Blog.objects.all(),
         view_name='blog-detail'
     )
-    comment_parent = serializers.HyperlinkedRelatedField(
+    comment_parent = PreloadedHyperlinkedRelatedField(
         queryset=Comment.objects.all(),
         view_name='comment-detail',
         required=False,
         allow_null=True
     )
-    commenter = serializers.HyperlinkedRelatedField(
+    commenter = PreloadedHyperlinkedRelatedField(
         queryset=CustomUser.objects.all(),
         view_name='customuser-detail'
     )
@@ -101,12 +209,47 @@ class CommentSerializer(serializers.HyperlinkedModelSerializer):
         model = Comment
         fields = '__all__'
 
+    def validate(self, attrs):
+        parent = attrs.get('comment_parent', getattr(self.instance, 'comment_parent', None))
+        blog = attrs.get('blog', getattr(self.instance, 'blog', None))
+
+        if parent:
+            if parent.blog_id != blog.pk:
+                raise serializers.ValidationError({'comment_parent': 'reply must belong to the same blog.'})
+            if self.instance and parent.is_descendant_of(self.instance):
+                raise serializers.ValidationError({'comment_parent': 'a comment cannot reply to itself or its replies.'})
+
+        return attrs
+
+def build_comment_tree(comments, context, last_depth, expand_url):
+    """
+    Nest comments ordered by ``path`` into reply trees. Comments at
+    ``last_depth`` whose replies were not loaded get ``has_more`` and an
+    ``expand`` link that loads their subtree.
+    """
+    roots, stack = [], []
+    data = CommentSerializer(comments, many=True, context=context).data
+
+    for comment, item in zip(comments, data):
+        node = dict(item)
+        node['replies'] = []
+
+        while stack and not comment.path.startswith(stack[-1][0].path):
+            stack.pop()
+        (stack[-1][1]['replies'] if stack else roots).append(node)
+        stack.append((comment, node))
+
+        node['has_more'] = comment.has_replies and comment.depth >= last_depth
+        node['expand'] = expand_url(comment) if node['has_more'] else None
+
+    return roots
+
 class PointSerializer(serializers.HyperlinkedModelSerializer):
-    blog = serializers.HyperlinkedRelatedField(
+    blog = PreloadedHyperlinkedRelatedField(
         queryset=Blog.objects.all(),
         view_name='blog-detail'
     )
-    pointer = serializers.HyperlinkedRelatedField(
+    pointer = PreloadedHyperlinkedRelatedField(
         queryset=CustomUser.objects.all(),
         view_name='customuser-detail'
     )
@@ -115,10 +258,27 @@ class PointSerializer(serializers.HyperlinkedModelSerializer):
         model = Point
         fields = '__all__'
 
+class RatingSerializer(serializers.Serializer):
+    star = serializers.IntegerField(min_value=1, max_value=5)
+    point_count = serializers.IntegerField(read_only=True)
+    point_average = serializers.FloatField(read_only=True)
+
+class ModerationSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000, write_only=True
+    )
+    updated = serializers.IntegerField(read_only=True)
+
 class BlogListSerializer(serializers.HyperlinkedModelSerializer):
+    # only present on full-text search results
+    search_rank = serializers.FloatField(read_only=True)
+    search_snippet = serializers.CharField(read_only=True)
+    cover_image_derivatives = ImageDerivativesField()
+
     class Meta:
         model = Blog
         fields = '__all__'
+        expandable_fields = {'author': AuthorProfileSerializer, 'sub_categories': SubCategorySerializer}
 
 class BlogDetailSerializer(serializers.HyperlinkedModelSerializer):
     author = serializers.HyperlinkedRelatedField(
@@ -130,40 +290,35 @@ class BlogDetailSerializer(serializers.HyperlinkedModelSerializer):
         many=True,
         view_name='subcategory-detail'
     )
-    blog_comments = CommentSerializer(many=True, read_only=True)
-    blog_points = PointSerializer(many=True, read_only=True)
+    blog_comments = RelatedPageField(
+        CommentSerializer, 'blog_comments', 'blog-comments',
+        count_field='comment_count', ordering=('created_at', 'id')
+    )
+    blog_points = RelatedPageField(
+        PointSerializer, 'blog_points', 'blog-points',
+        count_field='point_count', ordering=('id',)
+    )
 
-    comment_count = serializers.SerializerMethodField()
-    point_average = serializers.SerializerMethodField()
-    point_count = serializers.SerializerMethodField()
+    point_average = serializers.FloatField(read_only=True)
+    cover_image_derivatives = ImageDerivativesField()
 
     class Meta:
         model = Blog
         fields = [
-            'url', 'id', 'author', 'sub_categories', 'cover_image', 'title', 'slug',
+            'url', 'id', 'author', 'sub_categories', 'cover_image', 'cover_image_derivatives', 'title', 'slug',
             'body', 'created_at', 'updated_at', 'status',
             'blog_comments', 'blog_points',
             'comment_count', 'point_count', 'point_average'
         ]
-
-    def get_comment_count(self, obj):
-        return obj.blog_comments.count()
-
-    def get_point_count(self, obj):
-        return obj.blog_points.count()
-
-    def get_point_average(self, obj):
-        avg = obj.blog_points.aggregate(avg_star=Avg('star'))['avg_star']
-        return round(avg, 2) if avg else None
+        expandable_fields = {'author': AuthorProfileSerializer, 'sub_categories': SubCategorySerializer}
 
 class AuthorProfileRetrieveSerializer(serializers.HyperlinkedModelSerializer):
-    blog_count = serializers.SerializerMethodField()
-
-    def get_blog_count(self, obj):
-        return obj.author_blogs.count()
-    
-    author_blogs = BlogListSerializer(many=True, read_only=True)
+    profile_image_derivatives = ImageDerivativesField()
+    author_blogs = RelatedPageField(
+        BlogListSerializer, 'author_blogs', 'authorprofile-blogs',
+        count_field='blog_count', ordering=('created_at', 'id')
+    )
 
     class Meta:
         model = AuthorProfile
-        fields = ['url', 'id', 'user', 'profile_image', 'country', 'phone_number', 'status', 'blog_count', 'author_blogs']
\ No newline at end of file
+        fields = ['url', 'id', 'user', 'profile_image', 'profile_image_derivatives', 'country', 'phone_number', 'status', 'blog_count', 'author_blogs']
\ No newline at end of file
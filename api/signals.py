@@ -0,0 +1,32 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from blog.models import CustomUser
+from .authentication import forget_token
+
+
+def forget_tokens(keys, using=None):
+    # Forget now and once more after commit: until then, concurrent
+    # requests still read the old rows and may cache them again.
+    keys = list(keys)
+
+    def forget():
+        for key in keys:
+            forget_token(key)
+
+    forget()
+    transaction.on_commit(forget, using=using)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, using=None, **kwargs):
+    forget_tokens([instance.key], using)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_changed(sender, instance, created, raw=False, using=None, **kwargs):
+    if not created and not raw:
+        forget_tokens(Token.objects.using(using).filter(user_id=instance.pk).values_list('key', flat=True), using)
@@ -0,0 +1,36 @@
+"""
+Base test case for tests that run against a blog.seed dataset through the
+API, shared by the api and blog test modules.
+"""
+import warnings
+
+from django.core.paginator import UnorderedObjectListWarning
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from blog.models import Blog, CustomUser
+
+from .benchmarking import seed_dataset
+
+# a page read from an unordered queryset can repeat or skip rows
+warnings.filterwarnings('error', category=UnorderedObjectListWarning)
+
+
+class SeededTestCase(TestCase):
+    """
+    Seeds a dataset of ``dataset`` size once per class. ``user`` is its
+    first user and ``key`` that user's API token, ``blog`` the first blog,
+    and every test gets a ``client`` authenticated as ``user``.
+    """
+
+    dataset = {'users': 20, 'blogs': 10, 'comments_per_blog': 3, 'points_per_blog': 2}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.key = seed_dataset(**cls.dataset)
+        cls.user = CustomUser.objects.order_by('pk').first()
+        cls.blog = Blog.objects.order_by('pk').first()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
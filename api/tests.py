@@ -1,3 +1,969 @@
-from django.test import TestCase
+import base64
+import json
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient, APIRequestFactory
+
+from blog.models import CustomUser, AuthorProfile, Category, SubCategory, Blog, Comment, Point
+from .authentication import KEY_PREFIX, cache_token, get_local_cache
+from .bulk import BulkMixin
+from .pagination import KeysetPagination
+from .benchmarking import seed_dataset
+from .testing import SeededTestCase
+from .views import CustomUserViewSet, AuthorProfileViewSet, BlogViewSet, CommentViewSet, PointViewSet
+
+
+def image_file(name='cover.png'):
+    buffer = BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class QueryBudgetTests:
+    """
+    Every action of every viewset must stay within a fixed number of
+    queries and a total query time. The same budgets are checked against a
+    small and a large dataset, so anything that queries per row fails.
+    """
+
+    dataset = None
+    max_query_time = 0.5
+
+    # "<basename> <action>" -> most queries allowed
+    budgets = {
+        'customuser list': 2,
+        'customuser retrieve': 1,
+        'customuser create': 2,
+        'customuser update': 3,
+        'customuser partial_update': 3,
+        'customuser destroy': 10,
+        'me': 0,
+        'blog list': 3,
+        'blog retrieve': 5,
+        'blog create': 11,
+        'blog update': 17,
+        'blog partial_update': 7,
+        'blog destroy': 7,
+        'blog comments': 3,
+        'blog points': 3,
+        'blog comment_tree': 2,
+        'blog rating': 9,
+        'authorprofile list': 2,
+        'authorprofile retrieve': 4,
+        'authorprofile update': 3,
+        'authorprofile partial_update': 3,
+        'authorprofile blogs': 4,
+        'readerprofile list': 2,
+        'readerprofile retrieve': 1,
+        'readerprofile update': 2,
+        'readerprofile partial_update': 2,
+        'category list': 3,
+        'category retrieve': 2,
+        'category create': 3,
+        'category update': 5,
+        'category partial_update': 5,
+        'category destroy': 4,
+        'subcategory list': 2,
+        'subcategory retrieve': 1,
+        'subcategory create': 3,
+        'subcategory update': 4,
+        'subcategory partial_update': 3,
+        'subcategory destroy': 3,
+        'comment list': 2,
+        'comment retrieve': 1,
+        'comment create': 10,
+        'comment update': 12,
+        'comment partial_update': 8,
+        'comment destroy': 5,
+        'comment bulk': 10,
+        'comment bulk_update': 7,
+        'point list': 2,
+        'point retrieve': 1,
+        'point create': 8,
+        'point update': 10,
+        'point partial_update': 7,
+        'point destroy': 4,
+        'point bulk': 8,
+        'point bulk_update': 7,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        # uploaded images go to a scratch directory
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.reader = CustomUser.objects.filter(user_type='reader').order_by('pk').last()
+        cls.author = cls.blog.author
+        cls.reader_profile = cls.reader.reader_profile
+        cls.category = Category.objects.order_by('pk').first()
+        cls.sub_category = SubCategory.objects.order_by('pk').first()
+        # the last comment in tree order has no replies, so it can move under the first
+        comments = Comment.objects.filter(blog=cls.blog).order_by('path')
+        cls.parent, cls.comment = comments.first(), comments.last()
+        cls.point = Point.objects.filter(blog=cls.blog).order_by('pk').first()
+
+    def url(self, name, *args):
+        return 'http://testserver' + reverse(name, args=args)
+
+    def assertWithinBudget(self, name, method, url, data=None, format='json'):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format=format)
+        self.assertLess(response.status_code, 300, f'{name}: {response.status_code} {getattr(response, "data", "")}')
+
+        count = len(queries.captured_queries)
+        statements = '\n'.join(query['sql'] for query in queries.captured_queries)
+        self.assertLessEqual(count, self.budgets[name], f'{name} ran {count} queries:\n{statements}')
+        elapsed = sum(float(query['time']) for query in queries.captured_queries)
+        self.assertLessEqual(elapsed, self.max_query_time, f'{name} spent {elapsed:.3f}s in queries')
+        return response
+
+    def check_crud(self, basename, obj, payload, patch, new=None):
+        """list, retrieve, create, update, partial_update and destroy of one viewset."""
+        list_url = reverse(f'{basename}-list')
+        detail_url = reverse(f'{basename}-detail', args=[obj.pk])
+        with self.subTest('list'):
+            self.assertWithinBudget(f'{basename} list', 'get', list_url)
+        with self.subTest('retrieve'):
+            self.assertWithinBudget(f'{basename} retrieve', 'get', detail_url)
+        if new is None:
+            with self.subTest('update'):
+                self.assertWithinBudget(f'{basename} update', 'put', detail_url, payload(), format='multipart')
+            with self.subTest('partial_update'):
+                self.assertWithinBudget(f'{basename} partial_update', 'patch', detail_url, patch)
+            return
+        with self.subTest('create'):
+            self.assertWithinBudget(f'{basename} create', 'post', list_url, payload(), format='multipart')
+        with self.subTest('update'):
+            self.assertWithinBudget(f'{basename} update', 'put', detail_url, payload(), format='multipart')
+        with self.subTest('partial_update'):
+            self.assertWithinBudget(f'{basename} partial_update', 'patch', detail_url, patch)
+        with self.subTest('destroy'):
+            self.assertWithinBudget(f'{basename} destroy', 'delete', reverse(f'{basename}-detail', args=[new().pk]))
+
+    def test_users(self):
+        counter = iter(range(10 ** 6))
+
+        def payload():
+            return {'username': f'budget{next(counter)}', 'email': 'budget@example.com', 'user_type': 'reader'}
+
+        def new():
+            return CustomUser.objects.create(username=f'doomed{next(counter)}', user_type='admin')
+
+        self.check_crud('customuser', self.reader, payload, {'first_name': 'Budget'}, new)
+        with self.subTest('me'):
+            self.assertWithinBudget('me', 'get', reverse('me'))
+
+    def test_blogs(self):
+        def payload():
+            return {
+                'author': self.url('authorprofile-detail', self.author.pk),
+                'sub_categories': [self.url('subcategory-detail', self.sub_category.pk)],
+                'cover_image': image_file(),
+                'title': 'Query budgets',
+                'body': 'Every endpoint gets a fixed number of queries.',
+                'status': '1',
+            }
+
+        def new():
+            return Blog.objects.create(author=self.author, title='Doomed', body='doomed')
+
+        self.check_crud('blog', self.blog, payload, {'title': 'Query budgets'}, new)
+        for action in ('comments', 'points', 'comment_tree'):
+            with self.subTest(action):
+                url = reverse(f'blog-{action.replace("_", "-")}', args=[self.blog.pk])
+                self.assertWithinBudget(f'blog {action}', 'get', url)
+        with self.subTest('rating'):
+            self.assertWithinBudget('blog rating', 'put', reverse('blog-rating', args=[self.blog.pk]), {'star': 4})
+
+    def test_author_profiles(self):
+        def payload():
+            return {'profile_image': image_file('profile.png'), 'country': 'US', 'phone_number': '9123456789', 'status': '2'}
+
+        self.check_crud('authorprofile', self.author, payload, {'status': '2'})
+        with self.subTest('blogs'):
+            self.assertWithinBudget('authorprofile blogs', 'get', reverse('authorprofile-blogs', args=[self.author.pk]))
+
+    def test_reader_profiles(self):
+        self.check_crud('readerprofile', self.reader_profile, lambda: {'country': 'FR'}, {'country': 'IT'})
+
+    def test_categories(self):
+        def new():
+            return Category.objects.create(title='Doomed')
+
+        self.check_crud('category', self.category, lambda: {'title': 'Budgets'}, {'title': 'Patched'}, new)
+
+    def test_sub_categories(self):
+        def payload():
+            return {'category': self.url('category-detail', self.category.pk), 'title': 'Budgets'}
+
+        def new():
+            return SubCategory.objects.create(category=self.category, title='Doomed')
+
+        self.check_crud('subcategory', self.sub_category, payload, {'title': 'Patched'}, new)
+
+    def test_comments(self):
+        def payload():
+            return {
+                'blog': self.url('blog-detail', self.blog.pk),
+                'commenter': self.url('customuser-detail', self.reader.pk),
+                'comment_parent': self.url('comment-detail', self.parent.pk),
+                'body': 'Within budget.',
+            }
+
+        def new():
+            return Comment.objects.create(blog=self.blog, commenter=self.reader, body='doomed')
+
+        self.check_crud('comment', self.comment, payload, {'body': 'Patched'}, new)
+        with self.subTest('bulk'):
+            items = [dict(payload(), body=f'Bulk {i}') for i in range(20)]
+            self.assertWithinBudget('comment bulk', 'post', reverse('comment-bulk'), items)
+        with self.subTest('bulk_update'):
+            items = [
+                {'url': self.url('comment-detail', pk), 'body': 'Bulk patched.'}
+                for pk in Comment.objects.filter(blog=self.blog).values_list('pk', flat=True)[:3]
+            ]
+            self.assertWithinBudget('comment bulk_update', 'patch', reverse('comment-bulk'), items)
+
+    def test_points(self):
+        pointers = iter(CustomUser.objects.exclude(user_points__blog=self.blog).order_by('pk'))
+
+        def payload():
+            return {
+                'blog': self.url('blog-detail', self.blog.pk),
+                'pointer': self.url('customuser-detail', next(pointers).pk),
+                'star': 3,
+            }
+
+        def new():
+            return Point.objects.create(blog=self.blog, pointer=next(pointers), star=1)
+
+        self.check_crud('point', self.point, payload, {'star': 5}, new)
+        with self.subTest('bulk'):
+            items = [payload() for _ in range(10)]
+            self.assertWithinBudget('point bulk', 'post', reverse('point-bulk'), items)
+        with self.subTest('bulk_update'):
+            items = [
+                {'url': self.url('point-detail', pk), 'star': 2}
+                for pk in Point.objects.filter(blog=self.blog).values_list('pk', flat=True)[:3]
+            ]
+            self.assertWithinBudget('point bulk_update', 'patch', reverse('point-bulk'), items)
+
+
+class SmallDatasetQueryBudgetTests(QueryBudgetTests, SeededTestCase):
+    dataset = {'users': 30, 'blogs': 5, 'comments_per_blog': 3, 'points_per_blog': 2}
+
+
+class LargeDatasetQueryBudgetTests(QueryBudgetTests, SeededTestCase):
+    dataset = {'users': 200, 'blogs': 150, 'comments_per_blog': 12, 'points_per_blog': 8}
+
+
+class CompiledListTests(SeededTestCase):
+    """List pages served by api.compiled match the regular serializers byte for byte."""
+
+    dataset = {'users': 40, 'blogs': 120, 'comments_per_blog': 6, 'points_per_blog': 4}
+
+    def assertSameAsRegular(self, view_class, url):
+        compiled = self.client.get(url)
+        with patch.object(view_class, 'compiled_list', False):
+            regular = self.client.get(url)
+        self.assertEqual(compiled.status_code, 200)
+        self.assertEqual(compiled.content, regular.content)
+
+    def test_blogs(self):
+        for query in ('', '?search=python', '?pagination=keyset', '?ordering=-updated_at', '?status=2', '?page=2',
+                      '?fields=url,title&pagination=keyset', '?omit=sub_categories', '?omit=body'):
+            with self.subTest(query):
+                self.assertSameAsRegular(BlogViewSet, reverse('blog-list') + query)
+        for action in ('comments', 'points'):
+            with self.subTest(action):
+                self.assertSameAsRegular(BlogViewSet, reverse(f'blog-{action}', args=[self.blog.pk]))
+
+    def test_author_blogs(self):
+        self.assertSameAsRegular(AuthorProfileViewSet, reverse('authorprofile-blogs', args=[self.blog.author_id]))
+
+    def test_comments(self):
+        for query in ('', '?pagination=keyset', f'?blog={self.blog.pk}'):
+            with self.subTest(query):
+                self.assertSameAsRegular(CommentViewSet, reverse('comment-list') + query)
+
+    def test_points(self):
+        self.assertSameAsRegular(PointViewSet, reverse('point-list'))
+
+    @override_settings(ALLOWED_HOSTS=['first.example', 'second.example'])
+    def test_links_follow_the_request_host(self):
+        derivatives = {'webp': {'320': 'blog_image/derivatives/cover.jpg-320w.webp'}}
+        Blog.objects.update(cover_image_derivatives=derivatives)
+        url = reverse('blog-list') + '?fields=url,cover_image_derivatives'
+        for host in ('first.example', 'second.example'):
+            with self.subTest(host):
+                item = self.client.get(url, HTTP_HOST=host).json()['results'][0]
+                self.assertTrue(item['url'].startswith(f'http://{host}/'))
+                self.assertTrue(item['cover_image_derivatives']['webp']['320'].startswith(f'http://{host}/'))
+
+
+class AsyncViewTests(SeededTestCase):
+    """The async read views return what their sync counterparts do."""
+
+    dataset = {'users': 20, 'blogs': 15, 'comments_per_blog': 3, 'points_per_blog': 2}
+
+    def setUp(self):
+        # both sides authenticate with the token
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+
+    def get_async(self, url, **headers):
+        headers.setdefault('Authorization', f'Token {self.key}')
+        return async_to_sync(self.async_client.get)(url, headers=headers)
+
+    def test_same_json(self):
+        cases = [
+            ('blog-list', [], ''), ('blog-list', [], '?search=python'), ('blog-list', [], '?pagination=keyset'),
+            ('blog-list', [], '?status=2&ordering=-created_at'), ('blog-list', [], '?fields=url,title'),
+            ('blog-detail', [self.blog.pk], ''), ('category-list', [], ''), ('me', [], ''),
+        ]
+        for name, args, query in cases:
+            with self.subTest(f'{name}{query}'):
+                expected = self.client.get(reverse(name, args=args) + query)
+                response = self.get_async(reverse(f'async-{name}', args=args) + query)
+                self.assertEqual(response.status_code, 200, response.content)
+                data, expected = response.json(), expected.json()
+                if 'results' in expected:
+                    # pagination links point at the view that served the page
+                    data, expected = data['results'], expected['results']
+                self.assertEqual(data, expected)
+
+    def test_authentication(self):
+        url = reverse('async-blog-list')
+        self.assertEqual(self.get_async(url, Authorization='').status_code, 401)
+        response = self.get_async(url, Authorization='Token wrong')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    @override_settings(
+        CACHES={'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'async-tokens'}},
+        TOKEN_AUTH_CACHE={'CACHE_ALIAS': 'tokens'},
+    )
+    def test_shared_token_cache(self):
+        url = reverse('async-me')
+        self.assertEqual(self.get_async(url).status_code, 200)
+        self.assertIsNotNone(caches['tokens'].get(KEY_PREFIX + self.key))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_async(url).status_code, 200)
+        self.assertFalse(any('authtoken_token' in query['sql'] for query in queries.captured_queries))
+
+    def test_conditional_detail(self):
+        url = reverse('async-blog-detail', args=[self.blog.pk])
+        etag = self.get_async(url)['ETag']
+        self.assertEqual(self.get_async(url, **{'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.get_async(reverse('async-blog-detail', args=[10 ** 6])).status_code, 404)
+
+
+class FieldSelectionTests(SeededTestCase):
+    dataset = {'users': 20, 'blogs': 15, 'comments_per_blog': 3, 'points_per_blog': 2}
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), [query['sql'] for query in queries.captured_queries if 'blog_blog' in query['sql']]
+
+    def test_lists_send_the_excerpt_and_the_body(self):
+        data, _ = self.get(reverse('blog-list'))
+        self.assertEqual(data['results'][0]['excerpt'], self.blog.excerpt)
+        self.assertEqual(data['results'][0]['body'], self.blog.body)
+
+        # clients that only show the excerpt leave the body out of the query
+        data, queries = self.get(reverse('blog-list') + '?omit=body')
+        self.assertNotIn('body', data['results'][0])
+        self.assertFalse(any('"body"' in sql for sql in queries))
+
+    def test_fields(self):
+        data, queries = self.get(reverse('blog-list') + '?fields=url,title')
+        self.assertEqual(set(data['results'][0]), {'url', 'title'})
+        self.assertFalse(any('"excerpt"' in sql for sql in queries))
+
+        data, _ = self.get(reverse('blog-list') + '?fields=title,body')
+        self.assertEqual(data['results'][0], {'title': self.blog.title, 'body': self.blog.body})
+
+    def test_omit(self):
+        data, _ = self.get(reverse('blog-detail', args=[self.blog.pk]) + '?omit=blog_comments,blog_points,body')
+        self.assertNotIn('blog_comments', data)
+        self.assertNotIn('body', data)
+        self.assertEqual(data['title'], self.blog.title)
+
+    def test_related_lists(self):
+        data, _ = self.get(reverse('blog-comments', args=[self.blog.pk]) + '?fields=url,body')
+        self.assertEqual(set(data['results'][0]), {'url', 'body'})
+
+    def test_expand(self):
+        url = reverse('blog-list') + '?expand=author,sub_categories'
+        with CaptureQueriesContext(connection) as queries:
+            data, _ = self.get(url)
+        first = data['results'][0]
+        self.assertEqual(first['author']['country'], self.blog.author.country)
+        self.assertEqual(first['author']['url'], self.get(reverse('blog-list'))[0]['results'][0]['author'])
+        self.assertEqual(
+            sorted(item['title'] for item in first['sub_categories']),
+            sorted(self.blog.sub_categories.values_list('title', flat=True)),
+        )
+        # the author is joined and the sub-categories prefetched, not read per row
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(sum('blog_authorprofile' in query for query in sql), 1)
+        self.assertEqual(sum('blog_subcategory' in query for query in sql), 1)
+
+        data, _ = self.get(reverse('blog-detail', args=[self.blog.pk]) + '?expand=author')
+        self.assertEqual(data['author']['country'], self.blog.author.country)
+
+    def test_unknown_expand(self):
+        response = self.client.get(reverse('blog-list') + '?expand=title')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('title', response.json()['expand'])
+
+    def test_unknown_fields(self):
+        for query in ('?fields=title,secret', '?omit=secret'):
+            with self.subTest(query):
+                response = self.client.get(reverse('blog-list') + query)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('secret', response.json()['fields'])
+
+    def test_writes_ignore_the_selection(self):
+        url = reverse('blog-detail', args=[self.blog.pk])
+        response = self.client.patch(url + '?fields=title', {'status': '2'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIn('body', response.json())
+
+    def test_excerpt_follows_the_body(self):
+        self.blog.body = 'word ' * 200
+        self.blog.save(update_fields=['body'])
+        self.blog.refresh_from_db()
+        self.assertLessEqual(len(self.blog.excerpt), 300)
+        self.assertTrue(self.blog.excerpt.endswith('word…'))
+
+
+class KeysetPaginationTests(SeededTestCase):
+    dataset = {'users': 20, 'blogs': 30, 'comments_per_blog': 1, 'points_per_blog': 1}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # ties on created_at are broken by id
+        first = Blog.objects.order_by('created_at', 'id').first()
+        Blog.objects.filter(pk__in=Blog.objects.order_by('-id').values('pk')[:8]).update(created_at=first.created_at)
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(KeysetPagination, 'page_size', 7)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            pages.append([int(item['url'].rstrip('/').rsplit('/', 1)[1]) for item in data['results']])
+            url = data[link]
+        return pages
+
+    def test_forward_and_backward(self):
+        expected = list(Blog.objects.order_by('created_at', 'id').values_list('pk', flat=True))
+        forward = self.walk(reverse('blog-list') + '?pagination=keyset', 'next')
+        self.assertEqual([pk for page in forward for pk in page], expected)
+        self.assertTrue(all(len(page) == 7 for page in forward[:-1]))
+
+        # and back from the last page
+        last = self.client.get(reverse('blog-list') + '?pagination=keyset').json()
+        while last['next']:
+            last = self.client.get(last['next']).json()
+        self.assertEqual(self.walk(last['previous'], 'previous'), forward[-2::-1])
+
+    def test_invalid_cursors(self):
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+        for cursor in ('garbage', '%%%', encode({'r': 0}), encode({'r': 0, 'p': [1]}),
+                       encode({'r': 0, 'p': ['yesterday', 1]}), encode([1, 2]), encode({'r': 0, 'p': 5})):
+            with self.subTest(cursor):
+                response = self.client.get(reverse('blog-list'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+
+class BulkTests(SeededTestCase):
+    dataset = {'users': 20, 'blogs': 2, 'comments_per_blog': 2, 'points_per_blog': 2}
+
+    def url(self, name, pk):
+        return 'http://testserver' + reverse(name, args=[pk])
+
+    def comment(self, body):
+        return {
+            'blog': self.url('blog-detail', self.blog.pk),
+            'commenter': self.url('customuser-detail', self.user.pk),
+            'body': body,
+        }
+
+    def post(self, name, items):
+        response = self.client.post(reverse(name), items, format='json')
+        return response, [result['status'] for result in response.json()['results']]
+
+    def test_mixed_result(self):
+        response, statuses = self.post('comment-bulk', [self.comment('Valid.'), self.comment('')])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(statuses, [201, 400])
+        self.assertEqual(response.json()['created'], 1)
+        self.assertIn('body', response.json()['results'][1]['errors'])
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).comment_count, self.blog.comment_count + 1)
+
+        response, statuses = self.post('comment-bulk', [self.comment(''), self.comment('')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(statuses, [400, 400])
+
+    def test_unique_together(self):
+        rated = Point.objects.filter(blog=self.blog).first().pointer_id
+        fresh = CustomUser.objects.exclude(user_points__blog=self.blog).order_by('pk').first().pk
+
+        def point(pointer):
+            return {
+                'blog': self.url('blog-detail', self.blog.pk),
+                'pointer': self.url('customuser-detail', pointer),
+                'star': 4,
+            }
+
+        # one clashes with a stored row, the last with an earlier item
+        response, statuses = self.post('point-bulk', [point(rated), point(fresh), point(fresh)])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(statuses, [400, 201, 400])
+        self.assertEqual(Point.objects.filter(blog=self.blog, pointer_id=fresh).count(), 1)
+        blog = Blog.objects.get(pk=self.blog.pk)
+        self.assertEqual((blog.point_count, blog.point_sum), (self.blog.point_count + 1, self.blog.point_sum + 4))
+
+    def test_default_hook_saves_each_item(self):
+        with patch.object(CommentViewSet, 'perform_bulk_create', BulkMixin.perform_bulk_create):
+            response, statuses = self.post('comment-bulk', [self.comment('One.'), self.comment('Two.')])
+        self.assertEqual(response.status_code, 201)
+        created = Comment.objects.filter(body__in=['One.', 'Two.'])
+        self.assertEqual(len([comment for comment in created if comment.path]), 2)
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).comment_count, self.blog.comment_count + 2)
+
+    def patch(self, name, items):
+        response = self.client.patch(reverse(name), items, format='json')
+        return response, [result['status'] for result in response.json()['results']]
+
+    def test_update(self):
+        first, second = Point.objects.filter(blog=self.blog).order_by('pk')[:2]
+        response, statuses = self.patch('point-bulk', [
+            {'url': self.url('point-detail', first.pk), 'star': 5},
+            {'url': self.url('point-detail', second.pk), 'star': 9},
+            {'url': self.url('point-detail', 10 ** 6), 'star': 1},
+            {'url': self.url('point-detail', first.pk), 'star': 1},
+            {'star': 1},
+        ])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(statuses, [200, 400, 404, 400, 400])
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(response.json()['results'][0]['data']['star'], 5)
+        self.assertIn('star', response.json()['results'][1]['errors'])
+        blog = Blog.objects.get(pk=self.blog.pk)
+        self.assertEqual(blog.point_sum, self.blog.point_sum + 5 - first.star)
+
+        response, statuses = self.patch('point-bulk', [{'url': self.url('point-detail', 10 ** 6), 'star': 1}])
+        self.assertEqual(response.status_code, 404)
+
+    def test_update_moves_comments(self):
+        other = Blog.objects.order_by('pk').last()
+        moved, parent = [Comment.objects.create(blog=self.blog, commenter=self.user, body='Move.') for _ in range(2)]
+        counts = dict(Blog.objects.values_list('pk', 'comment_count'))
+
+        response, _ = self.patch('comment-bulk', [
+            {'url': self.url('comment-detail', moved.pk), 'comment_parent': self.url('comment-detail', parent.pk)},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        moved.refresh_from_db()
+        self.assertEqual((moved.path, moved.depth), (f'{parent.path}{moved.pk:010d}', parent.depth + 1))
+
+        response, _ = self.patch('comment-bulk', [
+            {'url': self.url('comment-detail', parent.pk), 'blog': self.url('blog-detail', other.pk),
+             'comment_parent': None},
+            {'url': self.url('comment-detail', moved.pk), 'blog': self.url('blog-detail', other.pk),
+             'comment_parent': None},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).comment_count, counts[self.blog.pk] - 2)
+        self.assertEqual(Blog.objects.get(pk=other.pk).comment_count, counts[other.pk] + 2)
+        moved.refresh_from_db()
+        self.assertEqual((moved.path, moved.depth), (f'{moved.pk:010d}', 0))
+
+    def test_default_update_hook_saves_each_item(self):
+        point = Point.objects.filter(blog=self.blog).order_by('pk').first()
+        with patch.object(PointViewSet, 'perform_bulk_update', BulkMixin.perform_bulk_update):
+            response, _ = self.patch('point-bulk', [{'url': self.url('point-detail', point.pk), 'star': 5}])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Blog.objects.get(pk=self.blog.pk).point_sum, self.blog.point_sum + 5 - point.star)
+
+
+class RatingTests(SeededTestCase):
+    dataset = {'users': 20, 'blogs': 2, 'comments_per_blog': 0, 'points_per_blog': 3}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = CustomUser.objects.exclude(user_points__blog=cls.blog).order_by('pk').first()
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('blog-rating', args=[self.blog.pk])
+
+    def stored(self):
+        return Blog.objects.values_list('point_count', 'point_sum').get(pk=self.blog.pk)
+
+    def test_rate_and_rerate(self):
+        count, total = self.stored()
+        response = self.client.put(self.url, {'star': 4}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.stored(), (count + 1, total + 4))
+        self.assertEqual(response.json(), {
+            'star': 4, 'point_count': count + 1, 'point_average': round((total + 4) / (count + 1), 2),
+        })
+
+        # a re-rate replaces the star and leaves the count alone
+        response = self.client.put(self.url, {'star': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stored(), (count + 1, total + 1))
+        self.assertEqual(list(Point.objects.filter(blog=self.blog, pointer=self.user).values_list('star', flat=True)), [1])
+
+    def test_invalid(self):
+        self.assertEqual(self.client.put(self.url, {'star': 6}, format='json').status_code, 400)
+        self.assertEqual(self.client.put(reverse('blog-rating', args=[10 ** 6]), {'star': 3}, format='json').status_code, 404)
+        self.assertEqual(Point.objects.filter(pointer=self.user).count(), 0)
+
+
+class CommentTreeTests(SeededTestCase):
+    dataset = {'users': 10, 'blogs': 2, 'comments_per_blog': 8, 'points_per_blog': 0}
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('blog-comment-tree', args=[self.blog.pk])
+
+    def test_root(self):
+        root = Comment.objects.filter(blog=self.blog, comment_parent__isnull=False).first()
+        response = self.client.get(self.url, {'root': root.pk, 'depth': 2})
+        self.assertEqual(response.status_code, 200)
+        [node] = response.json()
+        self.assertTrue(node['url'].endswith(reverse('comment-detail', args=[root.pk])))
+        self.assertTrue(all(reply['replies'] == [] for reply in node['replies']))
+
+    def test_invalid_parameters(self):
+        for params in ({'root': 'abc'}, {'depth': 'deep'}):
+            with self.subTest(params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(params)), response.json())
+        other = Comment.objects.exclude(blog=self.blog).first()
+        self.assertEqual(self.client.get(self.url, {'root': other.pk}).status_code, 404)
+
+
+class RelatedPageTests(SeededTestCase):
+    dataset = {'users': 10, 'blogs': 2, 'comments_per_blog': 0, 'points_per_blog': 0}
+
+    def test_count_ahead_of_the_rows(self):
+        Blog.objects.filter(pk=self.blog.pk).update(comment_count=3)
+        response = self.client.get(reverse('blog-detail', args=[self.blog.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['blog_comments'], {'count': 3, 'next': None, 'results': []})
+
+
+class ConditionalRetrieveTests(SeededTestCase):
+    dataset = {'users': 20, 'blogs': 10, 'comments_per_blog': 2, 'points_per_blog': 2}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # the oldest blog leads the first page of its author's embedded blogs
+        cls.blog = Blog.objects.order_by('created_at', 'id').first()
+
+    def setUp(self):
+        super().setUp()
+        # validators taken before a change must differ from the ones after it
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Blog.objects.update(activity_at=an_hour_ago)
+        AuthorProfile.objects.update(activity_at=an_hour_ago)
+        self.blog_url = reverse('blog-detail', args=[self.blog.pk])
+        self.author_url = reverse('authorprofile-detail', args=[self.blog.author_id])
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assertNotModified(self, url, etag):
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_not_modified(self):
+        for url in (self.blog_url, self.author_url):
+            with self.subTest(url):
+                self.assertNotModified(url, self.etag(url))
+
+    def test_comments_change_the_author(self):
+        blog_etag, author_etag = self.etag(self.blog_url), self.etag(self.author_url)
+        Comment.objects.create(blog=self.blog, commenter=self.user, body='A new comment.')
+        self.assertModified(self.blog_url, blog_etag)
+        response = self.assertModified(self.author_url, author_etag)
+        embedded = response.json()['author_blogs']['results'][0]
+        self.assertTrue(embedded['url'].endswith(self.blog_url))
+        self.assertEqual(embedded['comment_count'], self.blog.comment_count + 1)
+
+    def test_ratings_change_the_author(self):
+        author_etag = self.etag(self.author_url)
+        response = self.client.put(reverse('blog-rating', args=[self.blog.pk]), {'star': 5}, format='json')
+        self.assertLess(response.status_code, 300)
+        self.assertModified(self.author_url, author_etag)
+
+    def test_clearing_a_sub_category(self):
+        blog_etag, author_etag = self.etag(self.blog_url), self.etag(self.author_url)
+        self.blog.sub_categories.first().sub_categories_blogs.clear()
+        self.assertModified(self.blog_url, blog_etag)
+        self.assertModified(self.author_url, author_etag)
+
+
+@override_settings(REQUEST_METRICS={'SAMPLE_RATE': 1.0, 'SLOW_REQUEST_MS': 0})
+class RequestMetricsTests(SeededTestCase):
+    def timings(self, response):
+        return {
+            name: float(duration.split('=')[1])
+            for name, duration, *_ in (item.strip().split(';') for item in response['Server-Timing'].split(','))
+        }
+
+    def test_serializer_time(self):
+        # the compiled list, the regular detail and its nested related pages
+        for url in (reverse('blog-list'), reverse('blog-detail', args=[self.blog.pk])):
+            with self.subTest(url), self.assertLogs('config.metrics', 'WARNING') as logs:
+                timings = self.timings(self.client.get(url))
+                self.assertEqual(set(timings), {'db', 'serializer', 'app', 'render', 'total'})
+                self.assertGreater(timings['serializer'], 0)
+                self.assertLessEqual(timings['db'] + timings['serializer'] + timings['render'], timings['total'])
+                self.assertIn('"serializer_ms"', logs.output[0])
+
+    def test_async_views(self):
+        self.async_client.force_login(self.user)
+        with self.assertLogs('config.metrics', 'WARNING'):
+            response = async_to_sync(self.async_client.get)(reverse('async-blog-list'))
+        self.assertEqual(response.status_code, 200)
+        timings = self.timings(response)
+        self.assertGreater(timings['db'], 0)
+        self.assertGreater(timings['serializer'], 0)
+        self.assertNotIn('0 queries', response['Server-Timing'])
+
+
+class TokenCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('token-user', password='password')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        get_local_cache().clear()
+        self.addCleanup(get_local_cache().clear)
+        self.client = APIClient()
+
+    def get_me(self, key):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        return self.client.get(reverse('me'))
+
+    def test_deactivated_user(self):
+        self.assertEqual(self.get_me(self.token.key).status_code, 200)
+        stale = Token.objects.select_related('user').get(pk=self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            # a concurrent request that read the row before the commit
+            cache_token(stale)
+        self.assertEqual(self.get_me(self.token.key).status_code, 401)
+
+    def test_regenerated_token(self):
+        self.assertEqual(self.get_me(self.token.key).status_code, 200)
+        stale = Token.objects.select_related('user').get(pk=self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+            token = Token.objects.create(user=self.user)
+            cache_token(stale)
+        self.assertEqual(self.get_me(stale.key).status_code, 401)
+        self.assertEqual(self.get_me(token.key).status_code, 200)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'reads SQLite query plans')
+class IndexUsageTests(TestCase):
+    """
+    Every filter and ordering the list endpoints accept, alone and combined,
+    is read through an index. A full scan is only allowed on an unfiltered
+    list that walks the table in the requested order, since it stops after
+    one page.
+    """
+
+    viewsets = [CustomUserViewSet, AuthorProfileViewSet, BlogViewSet, CommentViewSet, PointViewSet]
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=100, blogs=50, comments_per_blog=4, points_per_blog=2)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'")
+            cls.partial_indexes = {name for name, in cursor.fetchall()}
+
+    def combinations(self, viewset):
+        model = viewset.queryset.model
+        filters = [{}]
+        for name in getattr(viewset, 'filterset_fields', None) or ():
+            if model._meta.get_field(name).get_internal_type() == 'BooleanField':
+                # the few rows a flag is set on; the rest is most of the table
+                value = 'true'
+            else:
+                value = model.objects.filter(**{f'{name}__isnull': False}).values_list(name, flat=True).first()
+            filters.append({name: value})
+        orderings = [None] + [
+            f'{prefix}{name}' for name in getattr(viewset, 'ordering_fields', None) or () for prefix in ('', '-')
+        ]
+        for params in filters:
+            for ordering in orderings:
+                yield {**params, 'ordering': ordering} if ordering else params
+
+    def list_queryset(self, viewset, params):
+        request = Request(APIRequestFactory().get('/', params))
+        view = viewset(action='list', request=request, format_kwarg=None, args=(), kwargs={})
+        return view.filter_queryset(view.get_queryset())
+
+    def assertUsesIndexes(self, queryset, label):
+        plan = queryset[:api_settings.PAGE_SIZE].explain()
+        for line in plan.splitlines():
+            scan = re.search(r'\bSCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?', line)
+            if scan is None or scan.group(2) in self.partial_indexes:
+                continue
+            if not queryset.query.where and 'TEMP B-TREE FOR ORDER BY' not in plan:
+                continue
+            self.fail(f'{label} scans {scan.group(1)}:\n{plan}')
+
+    def test_list_filters_and_orderings(self):
+        for viewset in self.viewsets:
+            for params in self.combinations(viewset):
+                label = f'{viewset.__name__} {params}'
+                with self.subTest(label):
+                    self.assertUsesIndexes(self.list_queryset(viewset, params), label)
+
+    def test_keyset_pages(self):
+        for viewset in self.viewsets:
+            ordering = getattr(viewset, 'keyset_ordering', None)
+            if ordering:
+                with self.subTest(viewset.__name__):
+                    self.assertUsesIndexes(viewset.queryset.order_by(*ordering), viewset.__name__)
+
+    def test_pending_queues(self):
+        for model, ordering in ((Blog, ('created_at', 'id')), (Comment, ('created_at', 'id')), (AuthorProfile, ('id',))):
+            with self.subTest(model.__name__):
+                self.assertUsesIndexes(model.objects.filter(status='1').order_by(*ordering), model.__name__)
+
+
+class ModerationTests(SeededTestCase):
+    dataset = {'users': 30, 'blogs': 100, 'comments_per_blog': 15, 'points_per_blog': 2}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.staff = CustomUser.objects.create_user('moderator', password='password', is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.staff)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('moderation-list')).status_code, 403)
+        response = self.client.post(reverse('moderation-approve', args=['blogs']), {'ids': [1]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_queues(self):
+        data = self.client.get(reverse('moderation-list')).json()
+        self.assertEqual(data['comments']['pending'], Comment.objects.filter(status='1').count())
+
+        pending = list(Comment.objects.filter(status='1').order_by('created_at', 'id').values_list('pk', flat=True))
+        url, seen = reverse('moderation-detail', args=['comments']), []
+        while url:
+            page = self.client.get(url).json()
+            seen += [int(item['url'].rstrip('/').rsplit('/', 1)[1]) for item in page['results']]
+            url = page['next']
+        self.assertEqual(seen, pending)
+        self.assertEqual(self.client.get(reverse('moderation-detail', args=['points'])).status_code, 404)
+
+    def test_approve_comments(self):
+        # more ids than SQLite takes as parameters in one statement
+        ids = list(Comment.objects.values_list('pk', flat=True))
+        changing = Comment.objects.exclude(status='2')
+        expected, blog_ids = changing.count(), set(changing.values_list('blog_id', flat=True))
+        activity = dict(Blog.objects.values_list('pk', 'activity_at'))
+        counters = list(Blog.objects.order_by('pk').values_list('comment_count', 'point_count'))
+        url = reverse('moderation-approve', args=['comments'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json(), {'updated': expected})
+        self.assertFalse(Comment.objects.exclude(status='2').exists())
+        self.assertEqual(list(Blog.objects.order_by('pk').values_list('comment_count', 'point_count')), counters)
+        bumped = {pk for pk, activity_at in Blog.objects.values_list('pk', 'activity_at') if activity_at > activity[pk]}
+        self.assertEqual(bumped, blog_ids)
+
+        # one UPDATE per model and chunk of ids
+        size = connection.features.max_query_params or len(ids)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(sum(sql.startswith('UPDATE "blog_comment"') for sql in updates), -(-expected // size))
+        self.assertEqual(sum(sql.startswith('UPDATE "blog_blog"') for sql in updates), -(-len(blog_ids) // size))
+
+        # nothing left to change
+        self.assertEqual(self.client.post(url, {'ids': ids}, format='json').json(), {'updated': 0})
+
+    def test_reject_blogs(self):
+        blog = Blog.objects.filter(status='1').first()
+        before = Blog.objects.filter(pk=blog.pk).values('updated_at', 'activity_at').get()
+        author_activity = AuthorProfile.objects.get(pk=blog.author_id).activity_at
+        response = self.client.post(reverse('moderation-reject', args=['blogs']), {'ids': [blog.pk]}, format='json')
+        self.assertEqual(response.json(), {'updated': 1})
+
+        blog.refresh_from_db()
+        self.assertEqual(blog.status, '3')
+        self.assertGreater(blog.updated_at, before['updated_at'])
+        self.assertGreater(blog.activity_at, before['activity_at'])
+        self.assertGreater(AuthorProfile.objects.get(pk=blog.author_id).activity_at, author_activity)
+
+    def test_invalid_ids(self):
+        url = reverse('moderation-approve', args=['authors'])
+        for ids in ([], ['x'], list(range(1, 10002))):
+            with self.subTest(len(ids)):
+                self.assertEqual(self.client.post(url, {'ids': ids}, format='json').status_code, 400)
@@ -5,7 +5,7 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from .views import (
     CustomUserViewSet, BlogViewSet, AuthorProfileViewSet, ReaderProfileViewSet,
-    CategoryViewSet, SubCategoryViewSet, CommentViewSet, PointViewSet, RegisterView, MeView
+    CategoryViewSet, SubCategoryViewSet, CommentViewSet, PointViewSet, ModerationViewSet, RegisterView, MeView
 )
 
 schema_view = get_schema_view(
@@ -30,8 +30,10 @@ router.register(r'categories', CategoryViewSet)
 router.register(r'subcategories', SubCategoryViewSet)
 router.register(r'comments', CommentViewSet)
 router.register(r'points', PointViewSet)
+router.register(r'moderation', ModerationViewSet, basename='moderation')
 
 urlpatterns = [
+    path('async/', include('api.async_urls')),
     path('', include(router.urls)),
     path('register/', RegisterView.as_view(), name='register'),
     path('me/', MeView.as_view(), name='me'),
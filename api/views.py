@@ -1,8 +1,18 @@
-from rest_framework import viewsets, generics, filters
+from django.db.models import Exists, OuterRef
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from rest_framework import viewsets, generics, filters, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.reverse import reverse as api_reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from django_filters.rest_framework import DjangoFilterBackend
 
+from blog import bulk, moderation, ratings
+from config.db import retry_on_lock
 from blog.models import (
     CustomUser, Blog, AuthorProfile, ReaderProfile, Category, SubCategory,
     Comment, Point
@@ -12,10 +22,15 @@ from .serializers import (
     BlogListSerializer, BlogDetailSerializer, 
     AuthorProfileSerializer, AuthorProfileRetrieveSerializer, ReaderProfileSerializer,
     CategorySerializer, SubCategorySerializer,
-    CommentSerializer, PointSerializer
+    CommentSerializer, PointSerializer, RatingSerializer, ModerationSerializer, build_comment_tree
 )
+from .mixins import QueryPlanMixin, ConditionalRetrieveMixin
+from .bulk import BulkMixin
+from .compiled import CompiledListMixin
+from .filters import FullTextSearchFilter
+from .pagination import KeysetPagination
 
-class CustomUserViewSet(viewsets.ModelViewSet):
+class CustomUserViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     
     def get_serializer_class(self):
@@ -41,7 +56,7 @@ class MeView(APIView):
         serializer = CustomUserSerializer(request.user, context={'request': request})
         return Response(serializer.data)
 
-class AuthorProfileViewSet(viewsets.ModelViewSet):
+class AuthorProfileViewSet(ConditionalRetrieveMixin, CompiledListMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = AuthorProfile.objects.all()
     
     def get_serializer_class(self):
@@ -55,37 +70,193 @@ class AuthorProfileViewSet(viewsets.ModelViewSet):
     filterset_fields = ['country', 'status']
     search_fields = ['phone_number']
     ordering_fields = ['id']
+    keyset_ordering = None
 
-class ReaderProfileViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'], keyset_ordering=('created_at', 'id'))
+    def blogs(self, request, pk=None):
+        author = get_object_or_404(AuthorProfile.objects.only('pk'), pk=pk)
+        self.check_object_permissions(request, author)
+        return self.paginated_related_response(author.author_blogs.all(), BlogListSerializer, self.keyset_ordering)
+
+class ReaderProfileViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = ReaderProfile.objects.all()
     serializer_class = ReaderProfileSerializer
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
-class SubCategoryViewSet(viewsets.ModelViewSet):
+class SubCategoryViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     queryset = SubCategory.objects.all()
     serializer_class = SubCategorySerializer
 
-class BlogViewSet(viewsets.ModelViewSet):
+class BlogViewSet(ConditionalRetrieveMixin, CompiledListMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Blog.objects.all()
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return BlogDetailSerializer
+        if self.action == 'rating':
+            return RatingSerializer
         return BlogListSerializer
     
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
 
     filterset_fields = ['status', 'author', 'sub_categories']
     search_fields = ['title', 'body']
     ordering_fields = ['id', 'created_at', 'updated_at']
+    keyset_ordering = ('created_at', 'id')
+
+    @action(detail=True, methods=['get'])
+    def comments(self, request, pk=None):
+        blog = get_object_or_404(Blog.objects.only('pk'), pk=pk)
+        self.check_object_permissions(request, blog)
+        return self.paginated_related_response(blog.blog_comments.all(), CommentSerializer, self.keyset_ordering)
+
+    @action(detail=True, methods=['get'], keyset_ordering=('id',))
+    def points(self, request, pk=None):
+        blog = get_object_or_404(Blog.objects.only('pk'), pk=pk)
+        self.check_object_permissions(request, blog)
+        return self.paginated_related_response(blog.blog_points.all(), PointSerializer, self.keyset_ordering)
+
+    @action(detail=True, methods=['put'])
+    def rating(self, request, pk=None):
+        """Create or replace the current user's star rating of the blog."""
+        blog = get_object_or_404(Blog.objects.only('pk'), pk=pk)
+        self.check_object_permissions(request, blog)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        result = ratings.rate(blog.pk, request.user.pk, serializer.validated_data['star'])
+        if result is None:
+            raise Http404
+        created, blog = result
+        data = {
+            'star': serializer.validated_data['star'],
+            'point_count': blog.point_count,
+            'point_average': blog.point_average,
+        }
+        return Response(self.get_serializer(data).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    comment_tree_depth = 3
+    comment_tree_max_depth = 10
 
-class CommentViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'], url_path='comment-tree')
+    def comment_tree(self, request, pk=None):
+        blog = get_object_or_404(Blog.objects.only('pk'), pk=pk)
+        self.check_object_permissions(request, blog)
+
+        try:
+            depth = int(request.query_params.get('depth', self.comment_tree_depth))
+        except ValueError:
+            raise ValidationError({'depth': 'must be an integer.'})
+        depth = max(1, min(depth, self.comment_tree_max_depth))
+
+        comments = Comment.objects.filter(blog=blog).annotate(
+            has_replies=Exists(Comment.objects.filter(comment_parent=OuterRef('pk')))
+        )
+        first_depth = 0
+        root_id = request.query_params.get('root')
+        if root_id:
+            try:
+                root_id = int(root_id)
+            except ValueError:
+                raise ValidationError({'root': 'must be an integer.'})
+            root = get_object_or_404(Comment.objects.only('path', 'depth'), pk=root_id, blog=blog)
+            comments = comments.filter(path__startswith=root.path)
+            first_depth = root.depth
+        last_depth = first_depth + depth - 1
+        comments = list(comments.filter(depth__lte=last_depth).order_by('path'))
+
+        url = request.build_absolute_uri(reverse('blog-comment-tree', kwargs={'pk': blog.pk}))
+        url = replace_query_param(url, 'depth', depth)
+
+        def expand_url(comment):
+            return replace_query_param(url, 'root', comment.pk)
+
+        tree = build_comment_tree(comments, self.get_serializer_context(), last_depth, expand_url)
+        return Response(tree)
+
+class CommentViewSet(BulkMixin, CompiledListMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
+    keyset_ordering = ('created_at', 'id')
+
+    def perform_create(self, serializer):
+        retry_on_lock(serializer.save)()
 
-class PointViewSet(viewsets.ModelViewSet):
+    def perform_bulk_create(self, instances):
+        return bulk.create_comments(instances)
+
+    def perform_bulk_update(self, instances, fields):
+        return bulk.update_comments(instances, fields)
+
+class PointViewSet(BulkMixin, CompiledListMixin, QueryPlanMixin, viewsets.ModelViewSet):
     queryset = Point.objects.all()
     serializer_class = PointSerializer
+    keyset_ordering = ('id',)
+
+    def perform_create(self, serializer):
+        retry_on_lock(serializer.save)()
+
+    def perform_bulk_create(self, instances):
+        return bulk.create_points(instances)
+
+    def perform_bulk_update(self, instances, fields):
+        return bulk.update_points(instances, fields)
+
+class ModerationViewSet(CompiledListMixin, QueryPlanMixin, viewsets.GenericViewSet):
+    """
+    Moderation queues for staff. ``moderation/<queue>/`` lists the pending
+    authors, blogs or comments oldest first with keyset pagination, and
+    ``moderation/<queue>/approve/`` and ``.../reject/`` take up to 10000
+    ``ids`` at once.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = KeysetPagination
+    serializer_class = ModerationSerializer
+    queue_serializers = {
+        'authors': AuthorProfileSerializer,
+        'blogs': BlogListSerializer,
+        'comments': CommentSerializer,
+    }
+
+    def get_queue(self):
+        if self.kwargs['pk'] not in moderation.QUEUES:
+            raise Http404
+        return moderation.QUEUES[self.kwargs['pk']]
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Comment.objects.none()
+        model, _ = self.get_queue()
+        return moderation.pending(model)
+
+    def list(self, request):
+        return Response({
+            name: {
+                'url': api_reverse('moderation-detail', kwargs={'pk': name}, request=request),
+                'pending': moderation.pending(model).count(),
+            }
+            for name, (model, _) in moderation.QUEUES.items()
+        })
+
+    def retrieve(self, request, pk=None):
+        _, self.keyset_ordering = self.get_queue()
+        return self.paginated_related_response(self.get_queryset(), self.queue_serializers[pk], self.keyset_ordering)
+
+    @action(detail=True, methods=['post'])
+    def approve(self, request, pk=None):
+        return self.moderate(moderation.APPROVED)
+
+    @action(detail=True, methods=['post'])
+    def reject(self, request, pk=None):
+        return self.moderate(moderation.REJECTED)
+
+    def moderate(self, status):
+        model, _ = self.get_queue()
+        serializer = self.get_serializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        updated = moderation.set_status(model, serializer.validated_data['ids'], status)
+        return Response(self.get_serializer({'updated': updated}).data)
@@ -1,8 +1,109 @@
 from django.contrib import admin
-from django.utils.safestring import mark_safe
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.db.models import CharField, Max, Min, Prefetch, Value
+from django.db.models.functions import Concat, Trim
+from django.urls import reverse
+from django.utils.functional import cached_property
 from django.utils.html import format_html
+from django.utils.http import urlencode
 
 from .models import CustomUser, AuthorProfile, ReaderProfile, Category, SubCategory, Blog, Comment, Point
+from . import images, moderation, search
+
+def thumbnail(field_file, derivatives, width=320):
+    name = images.pick(derivatives, width)
+    url = field_file.storage.url(name) if name else field_file.url
+    return format_html('<img src="{}" style="width: 150px; height: auto; border-radius: 10px;" loading="lazy" />', url)
+
+
+def full_name(user):
+    """``user``'s get_full_name() as an expression the changelists sort by."""
+    return Trim(Concat(f'{user}__first_name', Value(' '), f'{user}__last_name', output_field=CharField()))
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts unfiltered changelists of large tables from the primary key
+    range instead of a COUNT(*) over the whole table. Filtered and search
+    results, and tables under ``estimate_above`` rows, are counted exactly.
+    """
+
+    estimate_above = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            bounds = queryset.model._default_manager.using(queryset.db).aggregate(first=Min('pk'), last=Max('pk'))
+            if bounds['last'] is None:
+                return 0
+            estimate = bounds['last'] - bounds['first'] + 1
+            if estimate > self.estimate_above:
+                return estimate
+        return super().count
+
+
+def changelist_link(model, count, **filters):
+    """Link to the changelist of ``model`` filtered by ``filters``."""
+    opts = model._meta
+    url = reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+    return format_html('<a href="{}?{}">View all {} {}</a>', url, urlencode(filters), count, opts.verbose_name_plural)
+
+
+def moderate(modeladmin, request, queryset, status, verb):
+    ids = queryset.order_by().values_list('pk', flat=True)
+    updated = moderation.set_status(queryset.model, ids, status)
+    modeladmin.message_user(request, f'{updated} {queryset.model._meta.verbose_name_plural} {verb}.')
+
+def approve_selected(modeladmin, request, queryset):
+    moderate(modeladmin, request, queryset, moderation.APPROVED, 'approved')
+approve_selected.short_description = 'Approve selected %(verbose_name_plural)s'
+
+def reject_selected(modeladmin, request, queryset):
+    moderate(modeladmin, request, queryset, moderation.REJECTED, 'rejected')
+reject_selected.short_description = 'Reject selected %(verbose_name_plural)s'
+
+
+class LimitedInlineFormSet(BaseInlineFormSet):
+    """Inline formset over the first ``limit`` rows of its queryset."""
+
+    limit = None
+
+    def get_queryset(self):
+        if not hasattr(self, '_limited_queryset'):
+            self._limited_queryset = super().get_queryset()[:self.limit]
+        return self._limited_queryset
+
+
+class RecentInline(admin.TabularInline):
+    """
+    Read-only table of the newest ``limit`` related rows, however many
+    there are. The parent admin links to the changelist for the rest.
+    """
+
+    formset = LimitedInlineFormSet
+    limit = 20
+    extra = 0
+    show_change_link = True
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.limit = self.limit
+        return formset
+
+    def get_readonly_fields(self, request, obj=None):
+        return self.fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 class AuthorProfileInline(admin.StackedInline):
     model = AuthorProfile
@@ -16,30 +117,44 @@ class ReaderProfileInline(admin.StackedInline):
     verbose_name_plural = 'Reader Profile'
     fk_name = 'user'
 
-class BlogInline(admin.StackedInline):
+class BlogInline(RecentInline):
     model = Blog
     fk_name = 'author'
-    extra = 0
+    fields = ['title', 'status', 'created_at', 'comment_count', 'point_count']
+    ordering = ['-created_at', '-id']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('author__user')
 
 class SubCategoryInline(admin.StackedInline):
     model = SubCategory
     fk_name = 'category'
     extra = 0
 
-class CommentInline(admin.StackedInline):
+class CommentInline(RecentInline):
     model = Comment
     fk_name = 'blog'
-    extra = 0
+    fields = ['commenter', 'body', 'status', 'created_at']
+    ordering = ['-created_at', '-id']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('commenter')
 
-class PointInline(admin.StackedInline):
+class PointInline(RecentInline):
     model = Point
     fk_name = 'blog'
-    extra = 0
+    fields = ['pointer', 'star']
+    ordering = ['-id']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('pointer')
 
 class CustomUserAdmin(admin.ModelAdmin):
     list_display = ['id', 'user_type', 'username', 'get_full_name', 'is_superuser', 'last_login']
     list_filter = ['user_type', 'is_superuser']
     search_fields = ('username', )
+    # autocomplete results are paginated in this order
+    ordering = ['-id']
     inlines = []
 
     def get_full_name(self, obj):
@@ -56,17 +171,32 @@ class CustomUserAdmin(admin.ModelAdmin):
         return inline_instances
 
 class AuthorProfileAdmin(admin.ModelAdmin):
-    list_display = ['id', 'show_profile_image', 'get_full_name', 'country_flag', 'status']
+    list_display = ['id', 'show_profile_image', 'get_full_name', 'country_flag', 'status', 'blog_count']
     list_filter = ['status', 'country']
+    search_fields = ['user__username', 'user__first_name', 'user__last_name']
+    ordering = ['-id']
+    actions = [approve_selected, reject_selected]
+    readonly_fields = ['all_blogs']
     inlines = [BlogInline]
 
+    # also used by the author autocomplete of BlogAdmin, which shows __str__
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
+    def all_blogs(self, obj):
+        if obj.pk is None:
+            return '-'
+        return changelist_link(Blog, obj.blog_count, author__id__exact=obj.pk)
+    all_blogs.short_description = 'Blogs'
+
     def show_profile_image(self, obj):
-        return mark_safe(f'<img src="{obj.profile_image.url}" style="width: 150px; height: auto; border-radius: 10px;" />')
+        return thumbnail(obj.profile_image, obj.profile_image_derivatives)
     show_profile_image.short_description = 'Profile Image'
     
     def get_full_name(self, obj):
         return f'{obj.user.first_name} {obj.user.last_name}'
     get_full_name.short_description = 'Full Name'
+    get_full_name.admin_order_field = full_name('user')
 
     def country_flag(self, obj):
         return format_html(
@@ -83,10 +213,12 @@ class AuthorProfileAdmin(admin.ModelAdmin):
 class ReaderProfileAdmin(admin.ModelAdmin):
     list_display = ['id', 'get_user_name', 'country_flag']
     list_filter = ['country']
+    list_select_related = ['user']
     
     def get_user_name(self, obj):
         return f'{obj.user.username}'
     get_user_name.short_description = 'Full Name'
+    get_user_name.admin_order_field = 'user__username'
 
     def country_flag(self, obj):
         return format_html(
@@ -108,10 +240,23 @@ class BlogAdmin(admin.ModelAdmin):
     list_display = ['id', 'show_cover_image', 'filtered_title', 'get_author', 'get_sub_categories', 'comments_count', 'status']
     list_filter = ['status']
     search_fields = ['title', 'body']
+    ordering = ['-id']
+    actions = [approve_selected, reject_selected]
+    autocomplete_fields = ['author']
+    readonly_fields = ['all_comments', 'all_points']
     inlines = [CommentInline, PointInline]
+    paginator = EstimatedCountPaginator
+    # the unfiltered total would be one more COUNT(*) over the table
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        sub_categories = SubCategory.objects.select_related('category')
+        return super().get_queryset(request).select_related('author__user').prefetch_related(
+            Prefetch('sub_categories', queryset=sub_categories)
+        )
 
     def show_cover_image(self, obj):
-        return mark_safe(f'<img src="{obj.cover_image.url}" style="width: 150px; height: auto; border-radius: 10px;" />')
+        return thumbnail(obj.cover_image, obj.cover_image_derivatives)
     show_cover_image.short_description = 'Cover Image'
 
     def filtered_title(self, obj):
@@ -121,18 +266,50 @@ class BlogAdmin(admin.ModelAdmin):
     def get_author(self, obj):
         return f'{obj.author.user.get_full_name()}'
     get_author.short_description = 'Author'
+    get_author.admin_order_field = full_name('author__user')
 
     def get_sub_categories(self, obj):
         return ", ".join([f'{sub_category.title} ({sub_category.category})' for sub_category in obj.sub_categories.all()])
     get_sub_categories.short_description = 'Sub Categories'
 
     def comments_count(self, obj):
-        return obj.blog_comments.count()
+        return obj.comment_count
     comments_count.short_description = 'Comments Count'
+    comments_count.admin_order_field = 'comment_count'
+
+    def all_comments(self, obj):
+        if obj.pk is None:
+            return '-'
+        return changelist_link(Comment, obj.comment_count, blog__id__exact=obj.pk)
+    all_comments.short_description = 'Comments'
+
+    def all_points(self, obj):
+        if obj.pk is None:
+            return '-'
+        return changelist_link(Point, obj.point_count, blog__id__exact=obj.pk)
+    all_points.short_description = 'Points'
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        # sub categories are listed as "title (category)"
+        if db_field.name == 'sub_categories':
+            kwargs['queryset'] = SubCategory.objects.select_related('category')
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
+    def get_search_results(self, request, queryset, search_term):
+        terms = search_term.split()
+        if not terms or not search.is_available(queryset.db):
+            return super().get_search_results(request, queryset, search_term)
+        return search.search(queryset, terms), False
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = ['id', 'commenter', 'filtered_body', 'status']
     list_filter = ['status']
+    list_select_related = ['commenter']
+    autocomplete_fields = ['blog', 'commenter']
+    actions = [approve_selected, reject_selected]
+    raw_id_fields = ['comment_parent']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def filtered_body(self, obj):
         return f'{obj.body[:15]}{"..." if len(obj.body) > 15 else ""}'
@@ -143,4 +320,13 @@ admin.site.register(AuthorProfile, AuthorProfileAdmin)
 admin.site.register(ReaderProfile, ReaderProfileAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Blog, BlogAdmin)
-admin.site.register(Comment, CommentAdmin)
\ No newline at end of file
+class PointAdmin(admin.ModelAdmin):
+    list_display = ['id', 'blog', 'pointer', 'star']
+    list_filter = ['star']
+    list_select_related = ['blog__author__user', 'pointer']
+    autocomplete_fields = ['blog', 'pointer']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(Point, PointAdmin)
\ No newline at end of file
@@ -0,0 +1,99 @@
+from collections import defaultdict
+
+from config.db import retry_on_lock
+
+from .counters import adjust_blog_counters
+from .models import Comment, Point
+
+
+@retry_on_lock
+def create_comments(comments):
+    """
+    Insert unsaved ``comments`` with bulk_create and fill in what
+    Comment.save() and the signals maintain one row at a time: the
+    materialized paths and the blog counters. Parents must already exist.
+    """
+    Comment.objects.bulk_create(comments)
+
+    parent_ids = {comment.comment_parent_id for comment in comments if comment.comment_parent_id}
+    parents = {
+        pk: (path, depth)
+        for pk, path, depth in Comment.objects.filter(pk__in=parent_ids).values_list('pk', 'path', 'depth')
+    }
+    for comment in comments:
+        parent_path, parent_depth = parents.get(comment.comment_parent_id, ('', -1))
+        comment.path = f'{parent_path}{comment.pk:0{Comment.PATH_STEP}d}'
+        comment.depth = parent_depth + 1
+    Comment.objects.bulk_update(comments, ['path', 'depth'])
+
+    counts = defaultdict(int)
+    for comment in comments:
+        counts[comment.blog_id] += 1
+    for blog_id, count in counts.items():
+        adjust_blog_counters(blog_id, comments=count)
+    return comments
+
+
+@retry_on_lock
+def create_points(points):
+    """Insert unsaved ``points`` with bulk_create and update the blog counters."""
+    Point.objects.bulk_create(points)
+
+    totals = defaultdict(lambda: [0, 0])
+    for point in points:
+        totals[point.blog_id][0] += 1
+        totals[point.blog_id][1] += point.star
+    for blog_id, (count, stars) in totals.items():
+        adjust_blog_counters(blog_id, points=count, stars=stars)
+    return points
+
+
+@retry_on_lock
+def update_comments(comments, fields):
+    """
+    Write ``fields`` of ``comments`` with bulk_update and fill in what
+    Comment.save() and the signals maintain: the blog counters of comments
+    moved to another blog, and the paths of those given another parent.
+    """
+    previous = {
+        pk: (blog_id, parent_id)
+        for pk, blog_id, parent_id in Comment.objects.filter(pk__in=[comment.pk for comment in comments])
+        .values_list('pk', 'blog_id', 'comment_parent_id')
+    }
+    Comment.objects.bulk_update(comments, fields)
+
+    counts = defaultdict(int)
+    for comment in comments:
+        blog_id, parent_id = previous[comment.pk]
+        counts[blog_id] -= 1
+        counts[comment.blog_id] += 1
+        if parent_id != comment.comment_parent_id:
+            # an earlier move in the batch may have rewritten this subtree
+            comment.path, comment.depth = Comment.objects.values_list('path', 'depth').get(pk=comment.pk)
+            comment._update_path()
+    # a count of 0 still moves activity_at, as a save() would
+    for blog_id, count in counts.items():
+        adjust_blog_counters(blog_id, comments=count)
+    return comments
+
+
+@retry_on_lock
+def update_points(points, fields):
+    """Write ``fields`` of ``points`` with bulk_update and update the blog counters."""
+    previous = {
+        pk: (blog_id, star)
+        for pk, blog_id, star in Point.objects.filter(pk__in=[point.pk for point in points])
+        .values_list('pk', 'blog_id', 'star')
+    }
+    Point.objects.bulk_update(points, fields)
+
+    totals = defaultdict(lambda: [0, 0])
+    for point in points:
+        blog_id, star = previous[point.pk]
+        totals[blog_id][0] -= 1
+        totals[blog_id][1] -= star
+        totals[point.blog_id][0] += 1
+        totals[point.blog_id][1] += point.star
+    for blog_id, (count, stars) in totals.items():
+        adjust_blog_counters(blog_id, points=count, stars=stars)
+    return points
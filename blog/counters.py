@@ -0,0 +1,64 @@
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+
+from .models import AuthorProfile, Blog, Comment, Point
+
+
+def adjust_blog_counters(blog_id, comments=0, points=0, stars=0):
+    # activity_at feeds the conditional GET validators, so it moves on every
+    # child change even when no counter does
+    changes = {'activity_at': Now()}
+    if comments:
+        changes['comment_count'] = F('comment_count') + comments
+    if points:
+        changes['point_count'] = F('point_count') + points
+    if stars:
+        changes['point_sum'] = F('point_sum') + stars
+    blogs = Blog.objects.filter(pk=blog_id)
+    blogs.update(**changes)
+    _touch_authors_of(blogs)
+
+
+def adjust_author_counters(author_id, blogs=0):
+    changes = {'activity_at': Now()}
+    if blogs:
+        changes['blog_count'] = F('blog_count') + blogs
+    AuthorProfile.objects.filter(pk=author_id).update(**changes)
+
+
+def touch_blogs(blog_ids):
+    """Move activity_at of the blogs and of their authors."""
+    blogs = Blog.objects.filter(pk__in=blog_ids)
+    blogs.update(activity_at=Now())
+    _touch_authors_of(blogs)
+
+
+def _touch_authors_of(blogs):
+    # the author representation embeds its blogs, counters included; the
+    # authors are picked by a subquery, so this costs no extra SELECT
+    AuthorProfile.objects.filter(pk__in=blogs.values('author_id')).update(activity_at=Now())
+
+
+def _aggregate(queryset, field, function):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=function)
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def rebuild_counters():
+    blogs = Blog.objects.update(
+        comment_count=_aggregate(Comment.objects.all(), 'blog', Count('pk')),
+        point_count=_aggregate(Point.objects.all(), 'blog', Count('pk')),
+        point_sum=_aggregate(Point.objects.all(), 'blog', Sum('star')),
+    )
+    authors = AuthorProfile.objects.update(
+        blog_count=_aggregate(Blog.objects.all(), 'author', Count('pk')),
+    )
+    return blogs, authors
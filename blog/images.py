@@ -0,0 +1,147 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models.functions import Now
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WIDTHS': (320, 640, 1280),
+    'WORKERS': 2,
+    'ASYNC': True,
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# model label -> (image field, derivatives field)
+IMAGE_FIELDS = {
+    'blog.Blog': ('cover_image', 'cover_image_derivatives'),
+    'blog.AuthorProfile': ('profile_image', 'profile_image_derivatives'),
+}
+
+_executor = None
+
+
+def get_setting(name):
+    return getattr(settings, 'IMAGE_DERIVATIVES', {}).get(name, DEFAULTS[name])
+
+
+def derivative_name(name, width, extension):
+    # the original's extension stays in the name: x.jpg and x.png in the
+    # same directory must not share derivatives
+    directory, filename = os.path.split(name)
+    return f'{directory}/derivatives/{filename}-{width}w.{extension}'
+
+
+def _target_widths(original_width):
+    widths = [width for width in get_setting('WIDTHS') if width < original_width]
+    return widths or [original_width]
+
+
+def render_derivatives(field_file):
+    """
+    Write every configured width of ``field_file`` in each format next to the
+    original and return ``{format: {width: name}}``.
+    """
+    storage = field_file.storage
+    with field_file.open('rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+
+    derivatives = {extension: {} for extension in FORMATS}
+    for width in _target_widths(image.width):
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.Resampling.LANCZOS)
+        for extension, (image_format, options) in FORMATS.items():
+            target = resized
+            if image_format == 'JPEG' and target.mode not in ('RGB', 'L'):
+                target = target.convert('RGB')
+            buffer = BytesIO()
+            target.save(buffer, image_format, **options)
+            name = derivative_name(field_file.name, width, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            derivatives[extension][str(width)] = storage.save(name, ContentFile(buffer.getvalue()))
+    return derivatives
+
+
+def process(label, pk):
+    model = apps.get_model(label)
+    image_field, derivatives_field = IMAGE_FIELDS[label]
+    instance = model._default_manager.filter(pk=pk).only(image_field, derivatives_field).first()
+    if instance is None:
+        return None
+    field_file = getattr(instance, image_field)
+    if not field_file:
+        return None
+
+    derivatives = render_derivatives(field_file)
+    # only store them if the image was not replaced while we were rendering
+    updated = model._default_manager.filter(pk=pk, **{image_field: field_file.name}).update(
+        **{derivatives_field: derivatives, 'activity_at': Now()}
+    )
+    rendered = {name for sizes in derivatives.values() for name in sizes.values()}
+    if not updated:
+        # nothing refers to what was just rendered
+        for name in rendered:
+            field_file.storage.delete(name)
+        return None
+    previous = getattr(instance, derivatives_field) or {}
+    stale = {name for sizes in previous.values() for name in sizes.values()} - rendered
+    for name in stale:
+        field_file.storage.delete(name)
+    return derivatives
+
+
+def _run(label, pk):
+    try:
+        process(label, pk)
+    except Exception:
+        logger.exception('Could not render image derivatives for %s %s', label, pk)
+
+
+def _run_in_worker(label, pk):
+    close_old_connections()
+    try:
+        _run(label, pk)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=get_setting('WORKERS'), thread_name_prefix='image-derivatives')
+    return _executor
+
+
+def schedule(instance):
+    """Render the derivatives of ``instance`` once the current transaction commits."""
+    label = instance._meta.label
+
+    def submit():
+        if get_setting('ASYNC'):
+            get_executor().submit(_run_in_worker, label, instance.pk)
+        else:
+            _run(label, instance.pk)
+
+    transaction.on_commit(submit)
+
+
+def pick(derivatives, width, extension='jpeg'):
+    """Name of the smallest derivative at least ``width`` wide, or the largest one."""
+    sizes = sorted((int(size), name) for size, name in (derivatives or {}).get(extension, {}).items())
+    for size, name in sizes:
+        if size >= width:
+            return name
+    return sizes[-1][1] if sizes else None
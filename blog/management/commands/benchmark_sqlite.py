@@ -0,0 +1,149 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from blog.models import CustomUser, AuthorProfile, Blog, Comment
+from config.db import is_lock_error, retry_on_lock, set_journal_mode
+
+# name -> (database OPTIONS, journal mode, retry locked writes)
+PROFILES = {
+    'defaults': ({}, 'DELETE', False),
+    'tuned': (settings.DATABASES['default'].get('OPTIONS', {}), settings.SQLITE_JOURNAL_MODE, True),
+}
+
+
+def seed(blogs, users):
+    readers = CustomUser.objects.bulk_create([
+        CustomUser(username=f'benchmark{i}', first_name='Bench', last_name=str(i), user_type='reader')
+        for i in range(users)
+    ])
+    author = AuthorProfile.objects.bulk_create([
+        AuthorProfile(user=readers[0], profile_image='author_image/benchmark.jpg', country='US',
+                      phone_number='9123456789', blog_count=blogs)
+    ])[0]
+    rows = Blog.objects.bulk_create([
+        Blog(author=author, cover_image='blog_image/benchmark.jpg', title=f'Benchmark blog {i}',
+             slug=f'benchmark-blog-{i}', body='lorem ipsum dolor sit amet ' * 40, status='2')
+        for i in range(blogs)
+    ])
+    return [blog.pk for blog in rows], [user.pk for user in readers]
+
+
+def read(blog_ids):
+    blog_id = random.choice(blog_ids)
+    list(Blog.objects.filter(pk=blog_id).values('title', 'comment_count'))
+    list(Comment.objects.filter(blog_id=blog_id).order_by('-created_at', '-id').values('body')[:20])
+
+
+def write(blog_ids, user_ids):
+    if random.random() < 0.5:
+        Comment.objects.create(blog_id=random.choice(blog_ids), commenter_id=random.choice(user_ids), body='benchmark')
+        return
+    # Blog.save() reads the previous row inside its transaction before it
+    # writes, the pattern that fails at once under deferred transactions
+    blog = Blog.objects.get(pk=random.choice(blog_ids))
+    blog.title = f'Benchmark blog {random.random():.6f}'
+    blog.save()
+
+
+def run_workload(blog_ids, user_ids, threads, seconds, write_ratio, retry):
+    write_once = retry_on_lock(write) if retry else write
+    lock = threading.Lock()
+    stats = {'read': [], 'write': [], 'locked': 0}
+
+    def worker(_):
+        latencies = {'read': [], 'write': []}
+        locked = 0
+        deadline = time.perf_counter() + seconds
+        try:
+            while time.perf_counter() < deadline:
+                kind = 'write' if random.random() < write_ratio else 'read'
+                start = time.perf_counter()
+                try:
+                    write_once(blog_ids, user_ids) if kind == 'write' else read(blog_ids)
+                except OperationalError as error:
+                    if not is_lock_error(error):
+                        raise
+                    locked += 1
+                    continue
+                latencies[kind].append(time.perf_counter() - start)
+        finally:
+            connection.close()
+        with lock:
+            stats['read'].extend(latencies['read'])
+            stats['write'].extend(latencies['write'])
+            stats['locked'] += locked
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(threads)))
+    return stats
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0] * 1000 if values else 0.0
+    return statistics.quantiles(values, n=100)[percent - 1] * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure mixed read/write throughput on a scratch copy of the schema, with Django\'s default '
+        'SQLite connection settings and with the tuned DATABASES options plus retried writes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run.')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of operations that write.')
+        parser.add_argument('--blogs', type=int, default=100)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write('This benchmark needs the SQLite database engine.')
+            return
+
+        settings_dict = connection.settings_dict
+        original = {key: settings_dict[key] for key in ('NAME', 'OPTIONS', 'CONN_MAX_AGE')}
+        connection.close()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                template = os.path.join(directory, 'template.sqlite3')
+                settings_dict.update(NAME=template, OPTIONS=PROFILES['defaults'][0], CONN_MAX_AGE=0)
+                call_command('migrate', verbosity=0, interactive=False)
+                blog_ids, user_ids = seed(options['blogs'], users=20)
+                connection.close()
+
+                self.stdout.write(
+                    f'{options["threads"]} threads, {options["seconds"]:g}s per run, '
+                    f'{options["write_ratio"]:.0%} writes\n'
+                )
+                self.stdout.write(
+                    f'{"profile":<10}{"reads/s":>10}{"writes/s":>10}{"locked":>8}{"read p95":>10}{"write p95":>11}'
+                )
+                for name, (database_options, journal_mode, retry) in PROFILES.items():
+                    path = os.path.join(directory, f'{name}.sqlite3')
+                    shutil.copy(template, path)
+                    settings_dict.update(NAME=path, OPTIONS=database_options)
+                    set_journal_mode(journal_mode)
+                    connection.close()
+                    stats = run_workload(
+                        blog_ids, user_ids, options['threads'], options['seconds'], options['write_ratio'], retry
+                    )
+                    self.stdout.write(
+                        f'{name:<10}{len(stats["read"]) / options["seconds"]:>10.1f}'
+                        f'{len(stats["write"]) / options["seconds"]:>10.1f}{stats["locked"]:>8}'
+                        f'{percentile(stats["read"], 95):>8.1f}ms{percentile(stats["write"], 95):>9.1f}ms'
+                    )
+        finally:
+            connection.close()
+            settings_dict.update(original)
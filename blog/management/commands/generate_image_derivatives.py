@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from blog import images
+
+
+class Command(BaseCommand):
+    help = 'Render the resized WebP/JPEG derivatives of existing cover and profile images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(images.IMAGE_FIELDS), help='Only process one model.')
+        parser.add_argument('--force', action='store_true', help='Also re-render images that already have derivatives.')
+        parser.add_argument('--workers', type=int, default=images.get_setting('WORKERS'))
+
+    def handle(self, *args, **options):
+        labels = [options['model']] if options['model'] else list(images.IMAGE_FIELDS)
+        jobs = []
+        for label in labels:
+            image_field, derivatives_field = images.IMAGE_FIELDS[label]
+            queryset = apps.get_model(label)._default_manager.exclude(**{image_field: ''})
+            if not options['force']:
+                queryset = queryset.filter(**{derivatives_field: {}})
+            jobs.extend((label, pk) for pk in queryset.values_list('pk', flat=True))
+
+        def run(job):
+            close_old_connections()
+            try:
+                return images.process(*job)
+            except Exception as error:
+                self.stderr.write(f'{job[0]} {job[1]}: {error}')
+            finally:
+                close_old_connections()
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            for result in executor.map(run, jobs):
+                done += result is not None
+        self.stdout.write(self.style.SUCCESS(f'Rendered derivatives for {done} of {len(jobs)} images.'))
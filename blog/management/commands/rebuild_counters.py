@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored comment, point and blog counters from the source rows.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            blogs, authors = rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {blogs} blogs and {authors} authors.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the SQLite FTS5 index over blog titles and bodies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--no-optimize', action='store_true', help='Skip merging the index b-trees after the rebuild.')
+
+    def handle(self, *args, **options):
+        if not search.is_available(options['database']):
+            raise CommandError('Full-text search needs the SQLite database engine.')
+        search.rebuild_index(options['database'], optimize=not options['no_optimize'])
+        self.stdout.write(self.style.SUCCESS('Rebuilt the blog search index.'))
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import seed
+from blog.models import Comment
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with synthetic users, profiles, categories, blogs, comment reply trees and '
+        'points for load testing. Rows are added to what is already there; the same --seed gives the '
+        'same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--blogs', type=int, default=200000)
+        parser.add_argument('--comments', type=int, default=10, help='Comments per blog.')
+        parser.add_argument('--points', type=int, default=5, help='Points per blog.')
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--sub-categories', type=int, default=10, help='Sub categories per category.')
+        parser.add_argument('--reply-ratio', type=float, default=0.6, help='Share of comments that are replies.')
+        parser.add_argument('--max-depth', type=int, default=30, help='Deepest reply chain.')
+        parser.add_argument('--password', help='Password of every user, unusable when left out.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        max_depth = 1000 // Comment.PATH_STEP
+        if not 1 <= options['max_depth'] <= max_depth:
+            raise CommandError(f'--max-depth must be between 1 and {max_depth}.')
+        if not 0 <= options['reply_ratio'] <= 1:
+            raise CommandError('--reply-ratio must be between 0 and 1.')
+
+        started = time.perf_counter()
+
+        def progress(label, count):
+            self.stdout.write(f'{label}: {count} ({time.perf_counter() - started:.1f}s)')
+
+        try:
+            counts = seed.generate(
+                users=options['users'], blogs=options['blogs'], comments_per_blog=options['comments'],
+                points_per_blog=options['points'], categories=options['categories'],
+                sub_categories_per_category=options['sub_categories'], reply_ratio=options['reply_ratio'],
+                max_depth=options['max_depth'], password=options['password'], seed=options['seed'],
+                using=options['database'], progress=progress,
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {total} rows in {time.perf_counter() - started:.1f}s: '
+            + ', '.join(f'{count} {model._meta.verbose_name_plural}' for model, count in counts.items())
+        ))
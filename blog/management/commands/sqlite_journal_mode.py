@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from config.db import set_journal_mode
+
+
+class Command(BaseCommand):
+    help = 'Set the journal mode stored in the SQLite database file (SQLITE_JOURNAL_MODE by default).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('mode', nargs='?', default=settings.SQLITE_JOURNAL_MODE)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if connections[options['database']].vendor != 'sqlite':
+            raise CommandError('The journal mode is a setting of the SQLite database engine.')
+        mode = set_journal_mode(options['mode'], options['database'])
+        if mode.lower() != options['mode'].lower():
+            raise CommandError(f'SQLite kept the database in {mode} mode.')
+        self.stdout.write(self.style.SUCCESS(f'The database is in {mode} mode.'))
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def _aggregate(queryset, field, function):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=function)
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def populate_counters(apps, schema_editor):
+    AuthorProfile = apps.get_model('blog', 'AuthorProfile')
+    Blog = apps.get_model('blog', 'Blog')
+    Comment = apps.get_model('blog', 'Comment')
+    Point = apps.get_model('blog', 'Point')
+
+    Blog.objects.update(
+        comment_count=_aggregate(Comment.objects.all(), 'blog', Count('pk')),
+        point_count=_aggregate(Point.objects.all(), 'blog', Count('pk')),
+        point_sum=_aggregate(Point.objects.all(), 'blog', Sum('star')),
+    )
+    AuthorProfile.objects.update(
+        blog_count=_aggregate(Blog.objects.all(), 'author', Count('pk')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_alter_comment_comment_parent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorprofile',
+            name='blog_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='point_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='point_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# A copy of blog.search as of this migration, so later changes to that
+# module do not change what the migration does.
+CREATE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS blog_blog_fts USING fts5("
+    "title, body, content='blog_blog', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    """CREATE TRIGGER IF NOT EXISTS blog_blog_fts_ai AFTER INSERT ON blog_blog BEGIN
+        INSERT INTO blog_blog_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_blog_fts_ad AFTER DELETE ON blog_blog BEGIN
+        INSERT INTO blog_blog_fts(blog_blog_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_blog_fts_au AFTER UPDATE OF title, body ON blog_blog BEGIN
+        INSERT INTO blog_blog_fts(blog_blog_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO blog_blog_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    "INSERT INTO blog_blog_fts(blog_blog_fts) VALUES ('rebuild')",
+]
+
+DROP_STATEMENTS = [
+    'DROP TRIGGER IF EXISTS blog_blog_fts_ai',
+    'DROP TRIGGER IF EXISTS blog_blog_fts_ad',
+    'DROP TRIGGER IF EXISTS blog_blog_fts_au',
+    'DROP TABLE IF EXISTS blog_blog_fts',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # FTS5 is SQLite only, other databases search without the index
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_STATEMENTS), run(DROP_STATEMENTS)),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:13
+
+from django.db import migrations, models
+
+PATH_STEP = 10
+BATCH_SIZE = 500
+
+
+def populate_paths(apps, schema_editor):
+    Comment = apps.get_model('blog', 'Comment')
+
+    # Roots, then replies whose parent already has its path, one batch at a
+    # time. The parent is read through a join rather than a list of ids, and
+    # a written batch leaves the pending rows, so memory stays at one batch.
+    pending = Comment.objects.filter(path='').filter(
+        models.Q(comment_parent__isnull=True) | models.Q(comment_parent__path__gt='')
+    ).order_by('pk').values_list('pk', 'comment_parent__path', 'comment_parent__depth')
+    while True:
+        batch = list(pending[:BATCH_SIZE])
+        if not batch:
+            break
+        Comment.objects.bulk_update([
+            Comment(
+                pk=pk,
+                path=f'{parent_path or ""}{pk:0{PATH_STEP}d}',
+                depth=0 if parent_path is None else parent_depth + 1,
+            )
+            for pk, parent_path, parent_depth in batch
+        ], ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_blog_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=1000),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
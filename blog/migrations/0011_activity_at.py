@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_comment_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorprofile',
+            name='activity_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='activity_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_activity_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorprofile',
+            name='profile_image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='cover_image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
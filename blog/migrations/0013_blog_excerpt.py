@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:49
+
+from django.db import migrations, models
+
+EXCERPT_LENGTH = 300
+
+
+def make_excerpt(text, length):
+    text = ' '.join(text.split())
+    if len(text) <= length:
+        return text
+    return f'{text[:length - 1].rsplit(" ", 1)[0]}…'
+
+
+def populate_excerpts(apps, schema_editor):
+    Blog = apps.get_model('blog', 'Blog')
+
+    last_id = 0
+    while True:
+        blogs = list(Blog.objects.filter(id__gt=last_id).order_by('id').only('id', 'body')[:1000])
+        if not blogs:
+            break
+        for blog in blogs:
+            blog.excerpt = make_excerpt(blog.body, EXCERPT_LENGTH)
+        Blog.objects.bulk_update(blogs, ['excerpt'], batch_size=500)
+        last_id = blogs[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300),
+        ),
+        migrations.RunPython(populate_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('blog', '0013_blog_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='authorprofile',
+            index=models.Index(fields=['status', 'id'], name='author_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='authorprofile',
+            index=models.Index(fields=['country', 'id'], name='author_country_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['updated_at', 'id'], name='blog_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('status', '1')), fields=['created_at', 'id'], name='comment_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['user_type', 'id'], name='user_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(condition=models.Q(('is_staff', True)), fields=['id'], name='user_staff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(condition=models.Q(('is_superuser', True)), fields=['id'], name='user_superuser_idx'),
+        ),
+    ]
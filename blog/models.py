@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator, MaxValueValidator, MinValueValidator
+from django.db.models.functions import Concat, Substr
 
 from django_countries.fields import CountryField
 from autoslug import AutoSlugField
@@ -17,6 +18,12 @@ class CustomUser(AbstractUser):
     class Meta:
         verbose_name = 'user'
         verbose_name_plural = 'users'
+        indexes = [
+            models.Index(fields=['user_type', 'id'], name='user_type_idx'),
+            # few users are staff or superusers, the index only holds those
+            models.Index(fields=['id'], condition=models.Q(is_staff=True), name='user_staff_idx'),
+            models.Index(fields=['id'], condition=models.Q(is_superuser=True), name='user_superuser_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user_type}: {self.username}'
@@ -30,6 +37,7 @@ class AuthorProfile(models.Model):
 
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='author_profile', editable=False)
     profile_image = models.ImageField(upload_to='author_image/')
+    profile_image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     country = CountryField(blank_label='(select country)')
     phone_number = models.CharField(
         max_length=10,
@@ -37,6 +45,15 @@ class AuthorProfile(models.Model):
         validators=[RegexValidator(r'^\d{10}$', message='Mobile number must be 10 digits long and without leading zeros')]
     )
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='1')
+    blog_count = models.PositiveIntegerField(default=0, editable=False)
+    # last change to the profile or to anything its API representation embeds
+    activity_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='author_status_idx'),
+            models.Index(fields=['country', 'id'], name='author_country_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} profile'
@@ -71,6 +88,13 @@ class SubCategory(models.Model):
         verbose_name = 'sub category'
         verbose_name_plural = 'sub categories'
 
+def make_excerpt(text, length):
+    """``text`` on one line, cut at a word boundary to at most ``length`` characters."""
+    text = ' '.join(text.split())
+    if len(text) <= length:
+        return text
+    return f'{text[:length - 1].rsplit(" ", 1)[0]}…'
+
 class Blog(models.Model):
     STATUS_CHOICES = (
         ('1', 'Awaiting confirmation'),
@@ -81,16 +105,49 @@ class Blog(models.Model):
     author = models.ForeignKey(AuthorProfile, on_delete=models.CASCADE, related_name='author_blogs')
     sub_categories = models.ManyToManyField(SubCategory, related_name='sub_categories_blogs')
     cover_image = models.ImageField(upload_to='blog_image/')
+    cover_image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     title = models.CharField(max_length=300)
     slug = AutoSlugField(populate_from='title', unique=True)
     body = models.TextField()
+    # start of the body, kept up to date by save() for list pages
+    excerpt = models.CharField(max_length=300, blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='1')
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    point_count = models.PositiveIntegerField(default=0, editable=False)
+    point_sum = models.PositiveIntegerField(default=0, editable=False)
+    # last change to the blog or to its comments and points
+    activity_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='blog_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='blog_status_created_idx'),
+            models.Index(fields=['author', 'created_at', 'id'], name='blog_author_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='blog_updated_idx'),
+        ]
 
     def __str__(self):
         return f'{self.title[:15]}{"..." if len(self.title) > 15 else ""} by {self.author.user.get_full_name()}'
 
+    def save(self, *args, **kwargs):
+        if 'body' not in self.get_deferred_fields():
+            self.excerpt = make_excerpt(self.body, self._meta.get_field('excerpt').max_length)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'body' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        # counters in blog.signals are updated inside the same transaction;
+        # no savepoint, a failed save rolls back whatever transaction it is in
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+    @property
+    def point_average(self):
+        if not self.point_count:
+            return None
+        return round(self.point_sum / self.point_count, 2)
+
 class Comment(models.Model):
     STATUS_CHOICES = (
         ('1', 'Awaiting confirmation'),
@@ -104,10 +161,52 @@ class Comment(models.Model):
     body = models.CharField(max_length=1000)
     created_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default='1')
+    # materialized path: the zero-padded ids of every ancestor and the comment itself
+    path = models.CharField(max_length=1000, default='', editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    PATH_STEP = 10
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='comment_created_idx'),
+            models.Index(fields=['blog', 'created_at', 'id'], name='comment_blog_created_idx'),
+            # the moderation queue, oldest first; confirmed comments stay out of it
+            models.Index(fields=['created_at', 'id'], condition=models.Q(status='1'), name='comment_pending_idx'),
+        ]
 
     def __str__(self):
         return f'{self.body[:15]}{"..." if len(self.body) > 15 else ""} by {self.commenter.username}'
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            self._update_path()
+
+    def _update_path(self):
+        parent_path, parent_depth = '', -1
+        if self.comment_parent_id:
+            parent_path, parent_depth = Comment.objects.values_list('path', 'depth').get(pk=self.comment_parent_id)
+        path = f'{parent_path}{self.pk:0{self.PATH_STEP}d}'
+        depth = parent_depth + 1
+        if path == self.path:
+            return
+        if self.path and parent_path.startswith(self.path):
+            raise ValueError('A comment cannot reply to itself or to one of its replies.')
+
+        if self.path:
+            # moved under another parent: rewrite the whole subtree in one statement
+            Comment.objects.filter(path__startswith=self.path).update(
+                path=Concat(models.Value(path), Substr('path', len(self.path) + 1)),
+                depth=models.F('depth') + (depth - self.depth),
+            )
+        else:
+            Comment.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        self.path, self.depth = path, depth
+
+    def is_descendant_of(self, other):
+        return bool(other.path) and self.path.startswith(other.path)
+
 class Point(models.Model):
     blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name='blog_points')
     star = models.IntegerField(
@@ -126,3 +225,7 @@ class Point(models.Model):
 
     def __str__(self):
         return f'{self.star} star by {self.pointer.username}'
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
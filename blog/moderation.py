@@ -0,0 +1,74 @@
+"""
+Bulk moderation of authors, blogs and comments: the pending queues and
+set-based status transitions used by the moderation API and the admin
+actions.
+"""
+from django.db import connection
+from django.db.models.functions import Now
+
+from config.db import retry_on_lock
+
+from .counters import touch_blogs
+from .models import AuthorProfile, Blog, Comment
+
+PENDING, APPROVED, REJECTED = '1', '2', '3'
+
+# queue name -> (model, keyset ordering), oldest first
+QUEUES = {
+    'authors': (AuthorProfile, ('id',)),
+    'blogs': (Blog, ('created_at', 'id')),
+    'comments': (Comment, ('created_at', 'id')),
+}
+
+
+def _touch_authors(author_ids):
+    AuthorProfile.objects.filter(pk__in=author_ids).update(activity_at=Now())
+
+
+# model -> (foreign key, touch); the parent's API representation embeds
+# the model, so its activity_at (the conditional GET validator) moves
+# when a row changes status
+PARENTS = {
+    Blog: ('author_id', _touch_authors),
+    Comment: ('blog_id', touch_blogs),
+}
+
+
+def pending(model):
+    return model.objects.filter(status=PENDING)
+
+
+def _chunks(ids):
+    ids = list(ids)
+    size = connection.features.max_query_params or len(ids) or 1
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+@retry_on_lock
+def set_status(model, ids, status):
+    """
+    Move the rows of ``model`` with ``ids`` to ``status`` and return how many
+    changed. Rows already in that status are left alone. Each step is one
+    statement per chunk of ids the database accepts as parameters: read the
+    rows that change, UPDATE them, then bump the activity_at of their
+    parents. The stored counters count rows whatever their status, so they
+    stay as they are.
+    """
+    parent = PARENTS.get(model)
+    columns = ['pk', parent[0]] if parent else ['pk']
+    changed, parent_ids = [], set()
+    for chunk in _chunks(ids):
+        for row in model.objects.filter(pk__in=chunk).exclude(status=status).values_list(*columns):
+            changed.append(row[0])
+            if parent:
+                parent_ids.add(row[1])
+
+    # auto_now fields move as they would on save()
+    touched = {field.name: Now() for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)}
+    for chunk in _chunks(changed):
+        model.objects.filter(pk__in=chunk).update(status=status, **touched)
+    if parent:
+        for chunk in _chunks(parent_ids):
+            parent[1](chunk)
+    return len(changed)
@@ -0,0 +1,34 @@
+from django.db.models.functions import Now
+
+from config.db import retry_on_lock
+
+from .counters import adjust_blog_counters
+from .models import Blog, Point
+
+
+@retry_on_lock
+def rate(blog_id, user_id, star):
+    """
+    Create or replace the rating ``user_id`` gives ``blog_id`` with a single
+    INSERT ... ON CONFLICT DO UPDATE, and keep the stored point count and
+    star sum in step within the same transaction. Returns ``(created,
+    blog)`` with the updated counters loaded, or None if the blog does not
+    exist.
+    """
+    # Writing the blog row first takes the write lock (the database lock
+    # on SQLite, the row lock elsewhere), so concurrent re-rates of the
+    # same blog read the previous star one after another.
+    if not Blog.objects.filter(pk=blog_id).update(activity_at=Now()):
+        return None
+    previous = Point.objects.filter(blog_id=blog_id, pointer_id=user_id).values_list('star', flat=True).first()
+    Point.objects.bulk_create(
+        [Point(blog_id=blog_id, pointer_id=user_id, star=star)],
+        update_conflicts=True,
+        unique_fields=['blog', 'pointer'],
+        update_fields=['star'],
+    )
+
+    created = previous is None
+    adjust_blog_counters(blog_id, points=int(created), stars=star if created else star - previous)
+    blog = Blog.objects.only('point_count', 'point_sum').get(pk=blog_id)
+    return created, blog
@@ -0,0 +1,113 @@
+from django.db import connections
+
+FTS_TABLE = 'blog_blog_fts'
+
+CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, body, content='blog_blog', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+)
+
+# blog_blog is rebuilt by the SQLite schema editor on most AlterField/AddField
+# migrations, which drops its triggers, so they are reinstalled after every
+# migrate (see blog.signals).
+CREATE_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON blog_blog BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON blog_blog BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, body ON blog_blog BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+
+DROP_STATEMENTS = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+
+def is_available(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def _table_exists(cursor):
+    cursor.execute('SELECT 1 FROM sqlite_master WHERE name = %s', [FTS_TABLE])
+    return cursor.fetchone() is not None
+
+
+def install_index(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        created = not _table_exists(cursor)
+        cursor.execute(CREATE_TABLE)
+        for statement in CREATE_TRIGGERS:
+            cursor.execute(statement)
+        if created:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall_index(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in DROP_STATEMENTS:
+            cursor.execute(statement)
+
+
+def reinstall_triggers(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if _table_exists(cursor):
+            for statement in CREATE_TRIGGERS:
+                cursor.execute(statement)
+
+
+def rebuild_index(using='default', optimize=True):
+    connection = connections[using]
+    install_index(using)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        if optimize:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+def build_match_query(terms):
+    # Every term is quoted so user input can never be parsed as FTS5 syntax,
+    # and prefix-matched to stay close to the old icontains behaviour.
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms if term)
+
+
+def search(queryset, terms, highlight=('<mark>', '</mark>'), snippet_tokens=16):
+    """
+    Restrict a Blog queryset to rows matching ``terms`` in the FTS5 index,
+    ordered by bm25 relevance, with ``search_rank`` and ``search_snippet``
+    annotations.
+    """
+    match = build_match_query(terms)
+    if not match:
+        return queryset
+    start, end = highlight
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = blog_blog.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+        select={
+            'search_rank': f'-bm25({FTS_TABLE}, %s, %s)',
+            'search_snippet': f'snippet({FTS_TABLE}, -1, %s, %s, %s, %s)',
+        },
+        select_params=[TITLE_WEIGHT, BODY_WEIGHT, start, end, '…', snippet_tokens],
+        order_by=['-search_rank'],
+    )
@@ -0,0 +1,230 @@
+"""
+Synthetic data for load tests: users with author and reader profiles,
+categories, blogs with their sub categories, comment reply trees and
+points, generated from a fixed random seed.
+
+Rows are built as tuples of column values and written with executemany,
+bypassing model instances, field pre_save and signals: slugs are
+precomputed instead of AutoSlugField querying for collisions on every
+row, timestamps are spread over time instead of auto_now, and comment
+paths, blog excerpts and the stored counters are filled in up front.
+"""
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import search
+from .models import make_excerpt, CustomUser, AuthorProfile, ReaderProfile, Category, SubCategory, Blog, Comment, Point
+
+WORDS = (
+    'python django sqlite index query cache cursor latency server async thread '
+    'request response session token page search ranking comment review design '
+    'model field migration schema router view template static media image '
+    'profile author reader category tag draft publish archive feed rating star'
+).split()
+
+COUNTRIES = ('US', 'DE', 'FR', 'GB', 'IR', 'IN', 'BR', 'JP', 'CA', 'NL')
+
+# blogs (with their comments and points) generated and written per step
+CHUNK_SIZE = 1000
+BATCH_SIZE = 5000
+
+Through = Blog.sub_categories.through
+
+# the columns written for each model, in the order the row tuples use
+COLUMNS = {
+    CustomUser: ('id', 'password', 'last_login', 'is_superuser', 'username', 'first_name', 'last_name', 'email',
+                 'is_staff', 'is_active', 'date_joined', 'user_type'),
+    AuthorProfile: ('id', 'user', 'profile_image', 'profile_image_derivatives', 'country', 'phone_number', 'status',
+                    'blog_count', 'activity_at'),
+    ReaderProfile: ('id', 'user', 'country'),
+    Category: ('id', 'title', 'slug'),
+    SubCategory: ('id', 'category', 'title', 'slug'),
+    Blog: ('id', 'author', 'cover_image', 'cover_image_derivatives', 'title', 'slug', 'body', 'excerpt',
+           'created_at', 'updated_at', 'status', 'comment_count', 'point_count', 'point_sum', 'activity_at'),
+    Through: ('id', 'blog', 'subcategory'),
+    Comment: ('id', 'blog', 'comment_parent', 'commenter', 'body', 'created_at', 'status', 'path', 'depth'),
+    Point: ('id', 'blog', 'star', 'pointer'),
+}
+
+
+def insert(model, rows, using='default'):
+    """Write tuples of database-ready values in the order of ``COLUMNS[model]``."""
+    if not rows:
+        return
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(name).column) for name in COLUMNS[model])
+    placeholders = ', '.join(['%s'] * len(COLUMNS[model]))
+    sql = f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), BATCH_SIZE):
+            cursor.executemany(sql, rows[start:start + BATCH_SIZE])
+
+
+def next_pk(model, using='default'):
+    return (model._base_manager.using(using).aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def generate(users=1000, blogs=5000, comments_per_blog=10, points_per_blog=5, categories=10,
+             sub_categories_per_category=5, reply_ratio=0.6, max_depth=30, password=None, seed=0,
+             using='default', progress=None):
+    """
+    Add the dataset on top of whatever the database holds and return the
+    number of rows written per model. Every tenth user is an author. A
+    comment replies with probability ``reply_ratio``, usually to the one
+    before it, which builds chains up to ``max_depth`` deep.
+    ``progress(label, count)`` is called as each stage finishes.
+    """
+    connection = connections[using]
+    rng = random.Random(seed)
+    report = progress or (lambda label, count: None)
+    counts = Counter()
+
+    now = timezone.now()
+    db_datetime = connection.ops.adapt_datetimefield_value
+    db_now = db_datetime(now)
+    no_derivatives = Blog._meta.get_field('cover_image_derivatives').get_db_prep_save({}, connection)
+    excerpt_length = Blog._meta.get_field('excerpt').max_length
+
+    def text(words):
+        return ' '.join(rng.choices(WORDS, k=words))
+
+    # one hash for everyone, hashing per row would dominate the run
+    password_hash = make_password(password)
+
+    with transaction.atomic(using=using):
+        first_user = next_pk(CustomUser, using)
+        user_ids = range(first_user, first_user + users)
+        author_ids, author_pk, reader_pk = [], next_pk(AuthorProfile, using), next_pk(ReaderProfile, using)
+        for start in range(0, users, CHUNK_SIZE):
+            rows, author_rows, reader_rows = [], [], []
+            for pk in user_ids[start:start + CHUNK_SIZE]:
+                user_type = 'author' if (pk - first_user) % 10 == 0 else 'reader'
+                joined = db_datetime(now - timedelta(days=730, seconds=first_user + users - pk))
+                rows.append((
+                    pk, password_hash, None, False, f'user{pk}', rng.choice(WORDS).title(), rng.choice(WORDS).title(),
+                    f'user{pk}@example.com', False, True, joined, user_type,
+                ))
+                if user_type == 'author':
+                    author_rows.append((
+                        author_pk, pk, f'author_image/user{pk}.jpg', no_derivatives, rng.choice(COUNTRIES),
+                        f'{9000000000 + pk % 1000000000}', rng.choice('123'), 0, db_now,
+                    ))
+                    author_ids.append(author_pk)
+                    author_pk += 1
+                else:
+                    reader_rows.append((reader_pk, pk, rng.choice(COUNTRIES)))
+                    reader_pk += 1
+            insert(CustomUser, rows, using)
+            insert(AuthorProfile, author_rows, using)
+            insert(ReaderProfile, reader_rows, using)
+            counts.update({CustomUser: len(rows), AuthorProfile: len(author_rows), ReaderProfile: len(reader_rows)})
+        report('users', users)
+
+        category_pk, sub_category_pk = next_pk(Category, using), next_pk(SubCategory, using)
+        category_rows, sub_category_rows = [], []
+        for pk in range(category_pk, category_pk + categories):
+            category_rows.append((pk, f'Category {pk}', f'category-{pk}'))
+            for n in range(sub_categories_per_category):
+                sub_category_rows.append((sub_category_pk, pk, f'Category {pk} topic {n}', f'category-{pk}-topic-{n}'))
+                sub_category_pk += 1
+        insert(Category, category_rows, using)
+        insert(SubCategory, sub_category_rows, using)
+        counts.update({Category: len(category_rows), SubCategory: len(sub_category_rows)})
+        report('categories', len(category_rows) + len(sub_category_rows))
+
+    if not blogs:
+        return counts
+
+    # comments, points and blogs can also go to users and authors that were already there
+    pool = user_ids or list(CustomUser.objects.using(using).values_list('pk', flat=True))
+    author_ids = author_ids or list(AuthorProfile.objects.using(using).values_list('pk', flat=True))
+    sub_category_ids = [row[0] for row in sub_category_rows] or list(
+        SubCategory.objects.using(using).values_list('pk', flat=True)
+    )
+    if not author_ids:
+        raise ValueError('Blogs need at least one author.')
+
+    blog_pk, through_pk = next_pk(Blog, using), next_pk(Through, using)
+    comment_pk, point_pk = next_pk(Comment, using), next_pk(Point, using)
+    span = timedelta(days=700).total_seconds()
+    blog_counts = Counter()
+
+    # the triggers would index every inserted blog one row at a time
+    rebuild_search = search.is_available(using)
+    if rebuild_search:
+        search.uninstall_index(using)
+
+    try:
+        for start in range(0, blogs, CHUNK_SIZE):
+            blog_rows, through_rows, comment_rows, point_rows = [], [], [], []
+            for i in range(start, min(start + CHUNK_SIZE, blogs)):
+                created_at = now - timedelta(seconds=span * (1 - i / blogs) + rng.random() * 60)
+                # a few prolific authors write most of the blogs
+                author_id = author_ids[int(len(author_ids) * rng.random() ** 2)]
+                blog_counts[author_id] += 1
+
+                # (id, path, depth) of the comments on this blog so far
+                thread, activity_at = [], created_at
+                for _ in range(comments_per_blog):
+                    parent = None
+                    if thread and rng.random() < reply_ratio:
+                        parent = thread[-1] if rng.random() < 0.7 else rng.choice(thread)
+                        if parent[2] + 1 >= max_depth:
+                            parent = None
+                    path = f'{parent[1] if parent else ""}{comment_pk:0{Comment.PATH_STEP}d}'
+                    depth = parent[2] + 1 if parent else 0
+                    activity_at += timedelta(minutes=rng.randint(1, 600))
+                    comment_rows.append((
+                        comment_pk, blog_pk, parent[0] if parent else None, rng.choice(pool),
+                        text(rng.randint(5, 40)), db_datetime(activity_at), rng.choice('123'), path, depth,
+                    ))
+                    thread.append((comment_pk, path, depth))
+                    comment_pk += 1
+
+                stars = []
+                for pointer_id in rng.sample(pool, min(points_per_blog, len(pool))):
+                    stars.append(rng.randint(1, 5))
+                    point_rows.append((point_pk, blog_pk, stars[-1], pointer_id))
+                    point_pk += 1
+
+                for sub_category_id in rng.sample(sub_category_ids, min(2, len(sub_category_ids))):
+                    through_rows.append((through_pk, blog_pk, sub_category_id))
+                    through_pk += 1
+
+                title, body = text(rng.randint(4, 9)).capitalize(), text(rng.randint(150, 400))
+                blog_rows.append((
+                    blog_pk, author_id, f'blog_image/cover{blog_pk}.jpg', no_derivatives, title,
+                    f'{slugify(title)[:200]}-{blog_pk}', body, make_excerpt(body, excerpt_length),
+                    db_datetime(created_at), db_datetime(created_at), rng.choice('123'), len(thread), len(stars),
+                    sum(stars), db_datetime(activity_at),
+                ))
+                blog_pk += 1
+
+            with transaction.atomic(using=using):
+                insert(Blog, blog_rows, using)
+                insert(Through, through_rows, using)
+                insert(Comment, comment_rows, using)
+                insert(Point, point_rows, using)
+            counts.update({
+                Blog: len(blog_rows), Through: len(through_rows), Comment: len(comment_rows), Point: len(point_rows),
+            })
+            report('blogs', counts[Blog])
+
+        with transaction.atomic(using=using):
+            AuthorProfile.objects.using(using).bulk_update(
+                [AuthorProfile(id=pk, blog_count=F('blog_count') + count) for pk, count in blog_counts.items()],
+                ['blog_count'], batch_size=500,
+            )
+    finally:
+        if rebuild_search:
+            search.rebuild_index(using)
+            report('search index', counts[Blog])
+    return counts
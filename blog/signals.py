@@ -0,0 +1,137 @@
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate, m2m_changed
+from django.dispatch import receiver
+
+from .models import AuthorProfile, Blog, Comment, Point
+from .counters import adjust_blog_counters, adjust_author_counters, touch_blogs
+from . import images, search
+
+
+def _remember_previous(instance, raw, *fields):
+    instance._previous = None
+    if not raw and instance.pk and not instance._state.adding:
+        instance._previous = type(instance).objects.filter(pk=instance.pk).values(*fields).first()
+
+
+def _image_changed(instance, field, created):
+    previous = getattr(instance, '_previous', None)
+    name = getattr(instance, field).name
+    if created or previous is None:
+        return bool(name)
+    return bool(name) and previous[field] != name
+
+
+@receiver(pre_save, sender=AuthorProfile)
+def author_profile_pre_save(sender, instance, raw=False, **kwargs):
+    _remember_previous(instance, raw, 'profile_image')
+
+
+@receiver(post_save, sender=AuthorProfile)
+def author_profile_post_save(sender, instance, created, raw=False, **kwargs):
+    if not raw and _image_changed(instance, 'profile_image', created):
+        images.schedule(instance)
+
+
+@receiver(pre_save, sender=Blog)
+def blog_pre_save(sender, instance, raw=False, **kwargs):
+    _remember_previous(instance, raw, 'author_id', 'cover_image')
+
+
+@receiver(post_save, sender=Blog)
+def blog_post_save(sender, instance, created, raw=False, **kwargs):
+    # fixtures carry their own counters, loaddata must not count the rows again
+    if raw:
+        return
+    if _image_changed(instance, 'cover_image', created):
+        images.schedule(instance)
+
+    previous = getattr(instance, '_previous', None)
+    if created:
+        adjust_author_counters(instance.author_id, blogs=1)
+    elif previous and previous['author_id'] != instance.author_id:
+        adjust_author_counters(previous['author_id'], blogs=-1)
+        adjust_author_counters(instance.author_id, blogs=1)
+    else:
+        adjust_author_counters(instance.author_id)
+
+
+@receiver(m2m_changed, sender=Blog.sub_categories.through)
+def blog_sub_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if kwargs.get('raw'):
+        return
+    if reverse and action == 'pre_clear':
+        # post_clear gets no pk_set, so the blogs are read before they go
+        instance._cleared_blog_ids = list(instance.sub_categories_blogs.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_blogs([instance.pk])
+    elif action == 'post_clear':
+        touch_blogs(instance.__dict__.pop('_cleared_blog_ids', ()))
+    else:
+        touch_blogs(pk_set)
+
+
+@receiver(post_delete, sender=Blog)
+def blog_post_delete(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    adjust_author_counters(instance.author_id, blogs=-1)
+
+
+@receiver(pre_save, sender=Comment)
+def comment_pre_save(sender, instance, raw=False, **kwargs):
+    _remember_previous(instance, raw, 'blog_id')
+
+
+@receiver(post_save, sender=Comment)
+def comment_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if created:
+        adjust_blog_counters(instance.blog_id, comments=1)
+    elif previous and previous['blog_id'] != instance.blog_id:
+        adjust_blog_counters(previous['blog_id'], comments=-1)
+        adjust_blog_counters(instance.blog_id, comments=1)
+    else:
+        adjust_blog_counters(instance.blog_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_post_delete(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    adjust_blog_counters(instance.blog_id, comments=-1)
+
+
+@receiver(pre_save, sender=Point)
+def point_pre_save(sender, instance, raw=False, **kwargs):
+    _remember_previous(instance, raw, 'blog_id', 'star')
+
+
+@receiver(post_save, sender=Point)
+def point_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if created:
+        adjust_blog_counters(instance.blog_id, points=1, stars=instance.star)
+    elif previous and previous['blog_id'] != instance.blog_id:
+        adjust_blog_counters(previous['blog_id'], points=-1, stars=-previous['star'])
+        adjust_blog_counters(instance.blog_id, points=1, stars=instance.star)
+    else:
+        adjust_blog_counters(instance.blog_id, stars=instance.star - previous['star'] if previous else 0)
+
+
+@receiver(post_delete, sender=Point)
+def point_post_delete(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    adjust_blog_counters(instance.blog_id, points=-1, stars=-instance.star)
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using, plan=None, **kwargs):
+    if sender.name == 'blog' and plan:
+        search.reinstall_triggers(using)
@@ -1,3 +1,488 @@
-from django.test import TestCase
 
-# Create your tests here.
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib import admin
+from django.core import serializers
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from PIL import Image
+
+from api.benchmarking import seed_dataset
+from api.testing import SeededTestCase
+from config.db import retry_on_lock
+from config.views import serve
+from . import images, search
+from .admin import EstimatedCountPaginator, RecentInline
+from .counters import rebuild_counters
+from .models import CustomUser, AuthorProfile, Category, Blog, Comment, Point
+
+
+class CounterTests(SeededTestCase):
+    """The stored counters follow every create, update, move and delete."""
+
+    dataset = {'users': 20, 'blogs': 3, 'comments_per_blog': 2, 'points_per_blog': 2}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.first, cls.second = Blog.objects.order_by('pk')[:2]
+
+    def counters(self, blog):
+        return Blog.objects.values_list('comment_count', 'point_count', 'point_sum').get(pk=blog.pk)
+
+    def assertMatchesRows(self):
+        def stored():
+            return (
+                list(Blog.objects.order_by('pk').values_list('pk', 'comment_count', 'point_count', 'point_sum')),
+                list(AuthorProfile.objects.order_by('pk').values_list('pk', 'blog_count')),
+            )
+
+        before = stored()
+        rebuild_counters()
+        self.assertEqual(before, stored())
+
+    def test_comments(self):
+        comments, points, stars = self.counters(self.first)
+        comment = Comment.objects.create(blog=self.first, commenter=self.user, body='Counted.')
+        self.assertEqual(self.counters(self.first), (comments + 1, points, stars))
+
+        comment.body = 'Edited.'
+        comment.save()
+        self.assertEqual(self.counters(self.first), (comments + 1, points, stars))
+
+        second = self.counters(self.second)
+        comment.blog = self.second
+        comment.save()
+        self.assertEqual(self.counters(self.first), (comments, points, stars))
+        self.assertEqual(self.counters(self.second)[0], second[0] + 1)
+
+        comment.delete()
+        self.assertEqual(self.counters(self.second), second)
+        self.assertMatchesRows()
+
+    def test_points(self):
+        comments, points, stars = self.counters(self.first)
+        pointer = CustomUser.objects.exclude(user_points__blog__in=[self.first, self.second]).first()
+        point = Point.objects.create(blog=self.first, pointer=pointer, star=3)
+        self.assertEqual(self.counters(self.first), (comments, points + 1, stars + 3))
+
+        point.star = 5
+        point.save()
+        self.assertEqual(self.counters(self.first), (comments, points + 1, stars + 5))
+
+        second = self.counters(self.second)
+        point.blog = self.second
+        point.save()
+        self.assertEqual(self.counters(self.first), (comments, points, stars))
+        self.assertEqual(self.counters(self.second), (second[0], second[1] + 1, second[2] + 5))
+
+        point.delete()
+        self.assertEqual(self.counters(self.second), second)
+        self.assertMatchesRows()
+
+    def test_blogs(self):
+        author, other = AuthorProfile.objects.order_by('pk')[:2]
+        counts = dict(AuthorProfile.objects.values_list('pk', 'blog_count'))
+        blog = Blog.objects.create(author=author, title='Counted', body='Counted.')
+        self.assertEqual(AuthorProfile.objects.get(pk=author.pk).blog_count, counts[author.pk] + 1)
+
+        blog.author = other
+        blog.save()
+        self.assertEqual(AuthorProfile.objects.get(pk=author.pk).blog_count, counts[author.pk])
+        self.assertEqual(AuthorProfile.objects.get(pk=other.pk).blog_count, counts[other.pk] + 1)
+
+        blog.delete()
+        self.assertEqual(dict(AuthorProfile.objects.values_list('pk', 'blog_count')), counts)
+        self.assertMatchesRows()
+
+    def test_loaddata_keeps_the_stored_counters(self):
+        # a dump of rows written through the ORM, so its counters already count them
+        with transaction.atomic():
+            author = AuthorProfile.objects.order_by('pk').first()
+            blog = Blog.objects.create(author=author, title='Loaded', body='Loaded.')
+            Comment.objects.create(blog=blog, commenter=self.user, body='Loaded.')
+            Point.objects.create(blog=blog, pointer=self.user, star=4)
+            rows = [AuthorProfile.objects.get(pk=author.pk), Blog.objects.get(pk=blog.pk), *blog.blog_comments.all(),
+                    *blog.blog_points.all()]
+            fixture = serializers.serialize('json', rows)
+            transaction.set_rollback(True)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as file:
+            file.write(fixture)
+            file.flush()
+            call_command('loaddata', file.name, verbosity=0)
+        self.assertEqual(self.counters(blog), (1, 1, 4))
+        self.assertMatchesRows()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'uses the SQLite FTS5 index')
+class SearchTests(SeededTestCase):
+    dataset = {'users': 20, 'blogs': 5, 'comments_per_blog': 0, 'points_per_blog': 0}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.author = AuthorProfile.objects.order_by('pk').first()
+
+    def found(self, *terms):
+        return list(search.search(Blog.objects.all(), terms).values_list('pk', flat=True))
+
+    def test_index_follows_writes(self):
+        blog = Blog.objects.create(author=self.author, title='Indexed', body='A zephyrquartz sighting.')
+        self.assertEqual(self.found('zephyrquartz'), [blog.pk])
+
+        blog.body = 'A marmalith sighting.'
+        blog.save()
+        self.assertEqual(self.found('zephyrquartz'), [])
+        self.assertEqual(self.found('marmalith'), [blog.pk])
+
+        Blog.objects.filter(pk=blog.pk).update(title='Glimmerfrost')
+        self.assertEqual(self.found('glimmer'), [blog.pk])
+        self.assertEqual(self.found('indexed'), [])
+
+        blog.delete()
+        self.assertEqual(self.found('marmalith'), [])
+        self.assertEqual(self.found('glimmerfrost'), [])
+
+    def test_rank(self):
+        in_body = Blog.objects.create(author=self.author, title='Notes', body='one mention of velvetine here')
+        in_title = Blog.objects.create(author=self.author, title='Velvetine', body='nothing else')
+        self.assertEqual(self.found('velvetine'), [in_title.pk, in_body.pk])
+
+        results = self.client.get(reverse('blog-list'), {'search': 'velvetine'}).json()['results']
+        self.assertEqual([item['title'] for item in results], ['Velvetine', 'Notes'])
+        self.assertGreater(results[0]['search_rank'], results[1]['search_rank'])
+        self.assertIn('<mark>velvetine</mark>', results[1]['search_snippet'])
+
+    def test_terms_are_not_fts_syntax(self):
+        for terms in (['"'], ['AND'], ['title:x'], ['NEAR(a', 'b)'], ['*']):
+            with self.subTest(terms):
+                self.assertEqual(self.found(*terms), [])
+
+
+class AdminQueryBudgetTests:
+    """
+    Every changelist in the admin must render within a fixed number of
+    queries and a total query time, for a small and a large dataset alike.
+    """
+
+    dataset = None
+    max_query_time = 0.5
+
+    # model name -> most queries allowed for its changelist
+    budgets = {
+        'customuser': 5,
+        'authorprofile': 5,
+        'readerprofile': 5,
+        'category': 5,
+        'blog': 6,
+        'comment': 5,
+        'point': 6,
+    }
+
+    # model name -> most queries allowed for a change page, inlines included
+    change_budgets = {
+        'authorprofile': 5,
+        'blog': 10,
+        'comment': 11,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(**cls.dataset)
+        cls.admin_user = CustomUser.objects.create_superuser('budget-admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def assertWithinBudget(self, url, budget):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        count = len(queries.captured_queries)
+        statements = '\n'.join(query['sql'] for query in queries.captured_queries)
+        self.assertLessEqual(count, budget, f'{url} ran {count} queries:\n{statements}')
+        elapsed = sum(float(query['time']) for query in queries.captured_queries)
+        self.assertLessEqual(elapsed, self.max_query_time, f'{url} spent {elapsed:.3f}s in queries')
+        return response
+
+    def assertChangelistWithinBudget(self, model_name, query=''):
+        url = reverse(f'admin:blog_{model_name}_changelist') + query
+        return self.assertWithinBudget(url, self.budgets[model_name])
+
+    def assertChangePageWithinBudget(self, obj):
+        model_name = obj._meta.model_name
+        url = reverse(f'admin:blog_{model_name}_change', args=[obj.pk])
+        return self.assertWithinBudget(url, self.change_budgets[model_name])
+
+    def test_every_changelist_has_a_budget(self):
+        registered = {model._meta.model_name for model in admin.site._registry if model._meta.app_label == 'blog'}
+        self.assertEqual(registered, set(self.budgets))
+
+    def test_customuser_changelist(self):
+        self.assertChangelistWithinBudget('customuser')
+
+    def test_authorprofile_changelist(self):
+        self.assertChangelistWithinBudget('authorprofile')
+
+    def test_readerprofile_changelist(self):
+        self.assertChangelistWithinBudget('readerprofile')
+
+    def test_category_changelist(self):
+        self.assertChangelistWithinBudget('category')
+
+    def test_blog_changelist(self):
+        self.assertChangelistWithinBudget('blog')
+
+    def test_blog_changelist_search(self):
+        self.assertChangelistWithinBudget('blog', '?q=python')
+
+    def test_blog_changelist_sorted(self):
+        # by author name, then by the stored comment count
+        for query in ('?o=4', '?o=-6'):
+            with self.subTest(query):
+                self.assertChangelistWithinBudget('blog', query)
+
+    def test_blog_changelist_estimated_count(self):
+        with patch.object(EstimatedCountPaginator, 'estimate_above', 0):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('admin:blog_blog_changelist'))
+        self.assertEqual(response.context['cl'].result_count, Blog.objects.count())
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+
+    def test_comment_changelist(self):
+        self.assertChangelistWithinBudget('comment')
+
+    def test_point_changelist(self):
+        self.assertChangelistWithinBudget('point')
+
+    def test_blog_change_page(self):
+        blog = Blog.objects.order_by('-comment_count').first()
+        with patch.object(RecentInline, 'limit', 5):
+            response = self.assertChangePageWithinBudget(blog)
+        rows = {formset.formset.prefix: formset.formset.initial_form_count()
+                for formset in response.context['inline_admin_formsets']}
+        self.assertEqual(rows, {
+            'blog_comments': min(5, blog.comment_count), 'blog_points': min(5, blog.point_count),
+        })
+        self.assertContains(response, f'?blog__id__exact={blog.pk}')
+
+    def test_authorprofile_change_page(self):
+        author = AuthorProfile.objects.order_by('-blog_count').first()
+        with patch.object(RecentInline, 'limit', 5):
+            response = self.assertChangePageWithinBudget(author)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(formset.initial_form_count(), min(5, author.blog_count))
+        self.assertContains(response, f'?author__id__exact={author.pk}')
+
+    def test_comment_change_page(self):
+        # autocomplete and raw id widgets instead of a <select> of every user and comment
+        response = self.assertChangePageWithinBudget(Comment.objects.filter(comment_parent__isnull=False).first())
+        self.assertContains(response, 'data-field-name="blog"')
+        self.assertContains(response, 'data-field-name="commenter"')
+        self.assertContains(response, 'vForeignKeyRawIdAdminField', count=1)
+
+
+class SmallDatasetAdminQueryBudgetTests(AdminQueryBudgetTests, TestCase):
+    dataset = {'users': 30, 'blogs': 5, 'comments_per_blog': 3, 'points_per_blog': 2}
+
+
+class LargeDatasetAdminQueryBudgetTests(AdminQueryBudgetTests, TestCase):
+    dataset = {'users': 200, 'blogs': 150, 'comments_per_blog': 12, 'points_per_blog': 8}
+
+
+class ModerationActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=30, blogs=20, comments_per_blog=3, points_per_blog=2)
+        # only three authors, all of them waiting
+        AuthorProfile.objects.update(status='1')
+        cls.admin_user = CustomUser.objects.create_superuser('moderator', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def test_approve_and_reject(self):
+        for model, action, status in ((Blog, 'approve_selected', '2'), (Comment, 'reject_selected', '3'),
+                                      (AuthorProfile, 'approve_selected', '2')):
+            with self.subTest(model.__name__):
+                ids = list(model.objects.filter(status='1').values_list('pk', flat=True))
+                url = reverse(f'admin:blog_{model._meta.model_name}_changelist')
+                response = self.client.post(url, {'action': action, '_selected_action': ids}, follow=True)
+                self.assertContains(response, f'{len(ids)} {model._meta.verbose_name_plural}')
+                self.assertFalse(model.objects.filter(pk__in=ids).exclude(status=status).exists())
+
+
+class ImageDerivativeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=10, blogs=2, comments_per_blog=0, points_per_blog=0)
+        cls.blogs = list(Blog.objects.order_by('pk'))
+
+    def set_cover(self, blog, name, image_format):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), 'white').save(buffer, image_format)
+        name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        Blog.objects.filter(pk=blog.pk).update(cover_image=name)
+        return name
+
+    def names(self, derivatives):
+        return {name for sizes in derivatives.values() for name in sizes.values()}
+
+    def test_same_stem_in_one_directory(self):
+        self.set_cover(self.blogs[0], 'blog_image/cover.jpg', 'JPEG')
+        self.set_cover(self.blogs[1], 'blog_image/cover.png', 'PNG')
+        first = self.names(images.process('blog.Blog', self.blogs[0].pk))
+        second = self.names(images.process('blog.Blog', self.blogs[1].pk))
+        self.assertFalse(first & second)
+        self.assertTrue(all(default_storage.exists(name) for name in first | second))
+
+    def test_image_replaced_while_rendering(self):
+        blog = self.blogs[0]
+        self.set_cover(blog, 'blog_image/old.jpg', 'JPEG')
+        render = images.render_derivatives
+        rendered = {}
+
+        def render_then_replace(field_file):
+            rendered.update(render(field_file))
+            self.set_cover(blog, 'blog_image/new.jpg', 'JPEG')
+            return rendered
+
+        with patch.object(images, 'render_derivatives', render_then_replace):
+            self.assertIsNone(images.process('blog.Blog', blog.pk))
+        self.assertTrue(self.names(rendered))
+        self.assertFalse(any(default_storage.exists(name) for name in self.names(rendered)))
+        self.assertEqual(Blog.objects.get(pk=blog.pk).cover_image_derivatives, {})
+
+
+class FileServingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.root, ignore_errors=True)
+        for name, content in (('data.bin', b'0123456789'), ('app.css', b'body {}'),
+                              ('app.css.gz', b'gzip body'), ('app.css.br', b'brotli body')):
+            with open(os.path.join(cls.root, name), 'wb') as file:
+                file.write(content)
+
+    def get(self, path, **headers):
+        response = serve(RequestFactory().get(f'/media/{path}', **headers), path, document_root=self.root)
+        self.addCleanup(response.close)
+        return response
+
+    def content(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_range(self):
+        response = self.get('data.bin', HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(self.content(response), b'2345')
+
+        response = self.get('data.bin', HTTP_RANGE='bytes=-3')
+        self.assertEqual((response.status_code, self.content(response)), (206, b'789'))
+
+    def test_unsatisfiable_range(self):
+        response = self.get('data.bin', HTTP_RANGE='bytes=20-30')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_invalid_range_is_ignored(self):
+        for header in ('bytes=5-3', 'bytes=a-b', 'lines=1-2'):
+            with self.subTest(header):
+                response = self.get('data.bin', HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.content(response), b'0123456789')
+
+    def test_precompressed_variant(self):
+        for accept, encoding, content in (('gzip', 'gzip', b'gzip body'), ('gzip, br', 'br', b'brotli body'),
+                                          ('br;q=0, gzip', 'gzip', b'gzip body'), ('', None, b'body {}')):
+            with self.subTest(accept):
+                response = self.get('app.css', HTTP_ACCEPT_ENCODING=accept)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(self.content(response), content)
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_conditional_request(self):
+        etag = self.get('data.bin')['ETag']
+        response = self.get('data.bin', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get('data.bin', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_accel_redirect(self):
+        mapped = {'SENDFILE_BACKEND': 'x-accel-redirect', 'ACCEL_REDIRECT_LOCATIONS': {self.root: '/protected/'}}
+        with override_settings(FILE_SERVING=mapped):
+            self.assertEqual(self.get('data.bin')['X-Accel-Redirect'], '/protected/data.bin')
+        # roots without a location are streamed
+        with override_settings(FILE_SERVING={'SENDFILE_BACKEND': 'x-accel-redirect'}):
+            response = self.get('data.bin')
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertEqual(self.content(response), b'0123456789')
+
+
+class RetryOnLockTests(TransactionTestCase):
+    # an outer test transaction would make every call nested
+    def setUp(self):
+        patcher = patch('config.db.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def failing(self, failures, error='database is locked'):
+        calls = []
+
+        @retry_on_lock
+        def create():
+            calls.append(Category.objects.create(title=f'Attempt {len(calls)}'))
+            if len(calls) <= failures:
+                raise OperationalError(error)
+            return len(calls)
+
+        return create, calls
+
+    def test_retries_until_it_succeeds(self):
+        create, calls = self.failing(2)
+        self.assertEqual(create(), 3)
+        self.assertEqual(self.sleep.call_count, 2)
+        # every failed attempt was rolled back
+        self.assertEqual(list(Category.objects.values_list('title', flat=True)), ['Attempt 2'])
+
+    def test_gives_up(self):
+        create, calls = self.failing(10)
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            create()
+        self.assertEqual(len(calls), 5)
+        self.assertFalse(Category.objects.exists())
+
+    def test_other_errors_are_raised_at_once(self):
+        create, calls = self.failing(1, error='no such table: elsewhere')
+        with self.assertRaises(OperationalError):
+            create()
+        self.assertEqual(len(calls), 1)
+
+    def test_nested_calls_are_not_retried(self):
+        create, calls = self.failing(1)
+        with self.assertRaises(OperationalError), transaction.atomic():
+            create()
+        self.assertEqual(len(calls), 1)
+        self.sleep.assert_not_called()
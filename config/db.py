@@ -0,0 +1,48 @@
+import functools
+import random
+import time
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+LOCK_ERRORS = ('database is locked', 'database table is locked')
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and any(message in str(error) for message in LOCK_ERRORS)
+
+
+def retry_on_lock(func=None, *, using=None, attempts=5, delay=0.05, max_delay=1.0):
+    """
+    Run ``func`` in its own transaction and retry it, with exponential
+    backoff and full jitter, while SQLite reports the database as locked.
+    Only an outermost transaction can be retried: inside another atomic
+    block the error is raised as is.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    with transaction.atomic(using=using):
+                        return func(*args, **kwargs)
+                except OperationalError as error:
+                    nested = connections[using or DEFAULT_DB_ALIAS].in_atomic_block
+                    if nested or not is_lock_error(error) or attempt == attempts - 1:
+                        raise
+                time.sleep(random.uniform(0, min(max_delay, delay * 2 ** attempt)))
+
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
+
+
+def set_journal_mode(mode, using=DEFAULT_DB_ALIAS):
+    """
+    Switch the SQLite database behind ``using`` to journal ``mode`` and return
+    the mode it ended up in. The mode is written to the database file, so
+    this runs once per file rather than on every connection.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode = {mode}')
+        return cursor.fetchone()[0]
@@ -0,0 +1,221 @@
+import contextvars
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # share of requests that are measured, 0 leaves the middleware out entirely
+    'SAMPLE_RATE': 0.0,
+    # sampled requests slower than this (ms) are logged with their top queries
+    'SLOW_REQUEST_MS': 500,
+    'TOP_QUERIES': 5,
+    'SERVER_TIMING': True,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'REQUEST_METRICS', {}).get(name, DEFAULTS[name])
+
+
+# metrics of the sampled request being handled, if any
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+@contextmanager
+def measure_serialization():
+    """Count the block, minus its SQL, as serializer time of the sampled request."""
+    metrics = _current.get()
+    if metrics is None or metrics.serializing:
+        # not sampled, or nested in a serializer that is already timed
+        yield
+        return
+    metrics.serializing = True
+    start, db_time = time.perf_counter(), metrics.db_time
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        metrics.serializer_time += time.perf_counter() - start - (metrics.db_time - db_time)
+
+
+class RequestMetrics:
+    """Timings of one sampled request, installed as a database execute wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_ended = None
+        self.view_db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.render_time = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def start_view(self):
+        self.view_started = time.perf_counter()
+        self.view_db_time = self.db_time
+
+    def end_view(self):
+        if self.view_started is not None and self.view_ended is None:
+            self.view_ended = time.perf_counter()
+            self.view_db_time = self.db_time - self.view_db_time
+
+    @property
+    def app_time(self):
+        # time in the view that was spent neither in SQL nor in serializers
+        if self.view_ended is None:
+            return 0.0
+        return self.view_ended - self.view_started - self.view_db_time - self.serializer_time
+
+    def top_queries(self, limit):
+        """The ``limit`` statements with the most total time, identical SQL counted together."""
+        totals = {}
+        for sql, duration in self.queries:
+            count, total = totals.get(sql, (0, 0.0))
+            totals[sql] = (count + 1, total + duration)
+        ranked = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [{'sql': sql, 'count': count, 'ms': round(total * 1000, 2)} for sql, (count, total) in ranked]
+
+
+def wrap_connections(stack, metrics):
+    """Enter ``metrics`` as the execute wrapper of every connection of this thread on ``stack``."""
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(metrics))
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures a sample of requests: number of queries and SQL time, then
+    the time spent in serializers, in the rest of the view and in templates
+    or renderers, all outside SQL. Serializer time covers the blocks the
+    API wraps in measure_serialization(). The numbers go out as a
+    Server-Timing header, and sampled requests slower than SLOW_REQUEST_MS
+    are logged with their top queries. Configured by the REQUEST_METRICS
+    setting; with a SAMPLE_RATE of 0 Django drops the middleware when it
+    loads, so it costs nothing.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = get_setting('SAMPLE_RATE')
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_request_ms = get_setting('SLOW_REQUEST_MS')
+        self.top_queries = get_setting('TOP_QUERIES')
+        self.server_timing = get_setting('SERVER_TIMING')
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django runs a sync process_view through a thread under ASGI
+            self.process_view = self.aprocess_view
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        metrics = request.metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                wrap_connections(stack, metrics)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        metrics = request.metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                # connections belong to a thread, and the async ORM queries
+                # from the thread sync_to_async() hands this request
+                await sync_to_async(wrap_connections)(stack, metrics)
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, metrics)
+
+    def report(self, request, response, metrics):
+        metrics.end_view()
+        total = time.perf_counter() - metrics.started
+
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{len(metrics.queries)} queries"',
+                f'serializer;dur={metrics.serializer_time * 1000:.1f}',
+                f'app;dur={metrics.app_time * 1000:.1f}',
+                f'render;dur={metrics.render_time * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ])
+        if total * 1000 >= self.slow_request_ms:
+            self.log_slow_request(request, response, metrics, total)
+        return response
+
+    @staticmethod
+    def start_view(request):
+        metrics = getattr(request, 'metrics', None)
+        if metrics is not None:
+            metrics.start_view()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.start_view(request)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.start_view(request)
+
+    def process_template_response(self, request, response):
+        # render here, so the handler's own render() call finds it done
+        metrics = getattr(request, 'metrics', None)
+        if metrics is not None:
+            metrics.end_view()
+            start, db_time = time.perf_counter(), metrics.db_time
+            response.render()
+            metrics.render_time = time.perf_counter() - start - (metrics.db_time - db_time)
+        return response
+
+    def log_slow_request(self, request, response, metrics, total):
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'serializer_ms': round(metrics.serializer_time * 1000, 2),
+            'app_ms': round(metrics.app_time * 1000, 2),
+            'render_ms': round(metrics.render_time * 1000, 2),
+            'queries': len(metrics.queries),
+            'top_queries': metrics.top_queries(self.top_queries),
+        }
+        logger.warning('Slow request %s', json.dumps(record), extra={'request_metrics': record})
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,13 +81,37 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Applied to every new SQLite connection. busy_timeout (ms) makes writers
+# queue instead of failing, and a negative cache_size is in KiB.
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 134217728,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # under ASGI set this to 0, connections are not reused across requests there
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name} = {value}' for name, value in SQLITE_PRAGMAS.items()),
+            # take the write lock when a transaction starts, so it never has
+            # to be upgraded (which fails at once instead of waiting)
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# WAL lets readers run alongside the writer. The journal mode is stored in
+# the database file, so it is set once with `manage.py sqlite_journal_mode`
+# at deploy rather than on every connection, which would rewrite the file.
+SQLITE_JOURNAL_MODE = 'WAL'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -132,6 +157,42 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# collectstatic writes content-hashed names plus .gz/.br siblings (brotli is optional)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'config.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# /media/ and /static/ are served by config.views.serve. Set SENDFILE_BACKEND
+# to 'x-accel-redirect' (with ACCEL_REDIRECT_LOCATIONS mapping each document
+# root to an internal nginx location) or 'x-sendfile' to hand the transfer
+# to the front proxy.
+FILE_SERVING = {
+    'SENDFILE_BACKEND': None,
+    'ACCEL_REDIRECT_LOCATIONS': {},
+    'MEDIA_CACHE_CONTROL': 'public, max-age=86400',
+}
+
+# Resized WebP/JPEG copies of uploaded cover and profile images (blog.images)
+IMAGE_DERIVATIVES = {
+    'WIDTHS': (320, 640, 1280),
+    'WORKERS': 2,
+    'ASYNC': True,
+}
+
+# Server-Timing headers and a slow-request log for a sample of requests
+# (config.metrics). A SAMPLE_RATE of 0 disables the middleware.
+REQUEST_METRICS = {
+    'SAMPLE_RATE': 0.0,
+    'SLOW_REQUEST_MS': 500,
+    'TOP_QUERIES': 5,
+    'SERVER_TIMING': True,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -139,15 +200,22 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'blog.CustomUser'
 
+# resolved API tokens, see api.authentication
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'CACHE_ALIAS': None,
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.ApiPagination',
     'PAGE_SIZE': 100,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
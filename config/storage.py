@@ -0,0 +1,54 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also writes ``.gz`` (and ``.br`` when the
+    brotli package is installed) siblings of every compressible file, so
+    config.views.serve can send them as they are.
+    """
+
+    # keep {% static %} working before the first collectstatic
+    manifest_strict = False
+    compress_extensions = ('.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ttf', '.otf', '.eot', '.ico')
+    min_compress_size = 256
+    min_saving = 0.05
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(self.compress_extensions) and self.exists(name):
+                for compressed in self.compress(name):
+                    yield name, compressed, True
+
+    def compress(self, name):
+        with self.open(name) as source:
+            content = source.read()
+        if len(content) < self.min_compress_size:
+            return
+
+        encoders = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.append(('.br', lambda data: brotli.compress(data, quality=11)))
+
+        for suffix, encode in encoders:
+            compressed = encode(content)
+            target = name + suffix
+            if self.exists(target):
+                self.delete(target)
+            if len(compressed) <= len(content) * (1 - self.min_saving):
+                self._save(target, ContentFile(compressed))
+                yield target
@@ -0,0 +1,213 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+
+# names produced by ManifestStaticFilesStorage, e.g. base.5af66c1b1797.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# precompressed siblings written by config.storage, in order of preference
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_TYPES = re.compile(r'^(text/|application/(javascript|json|xml|manifest\+json)|image/svg\+xml|font/)')
+
+DEFAULTS = {
+    # None, 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd)
+    'SENDFILE_BACKEND': None,
+    # document root -> internal nginx location, for X-Accel-Redirect
+    'ACCEL_REDIRECT_LOCATIONS': {},
+    'IMMUTABLE_CACHE_CONTROL': 'public, max-age=31536000, immutable',
+    'CACHE_CONTROL': 'public, max-age=0, must-revalidate',
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'FILE_SERVING', {}).get(name, DEFAULTS[name])
+
+
+class RangeReader:
+    """File object limited to ``length`` bytes from its current position."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Return ``(start, end)`` for a single satisfiable byte range, ``None`` to
+    serve the whole file, or ``False`` when the range cannot be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # syntactically invalid, so the header is ignored
+        return None
+    if start >= size:
+        return False
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def accepted_encodings(header):
+    encodings = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q=') and quality[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        if coding:
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+def _precompressed(request, fullpath):
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    for coding, suffix in PRECOMPRESSED:
+        if coding in accepted or '*' in accepted:
+            try:
+                stat_result = os.stat(fullpath + suffix)
+            except OSError:
+                continue
+            if stat.S_ISREG(stat_result.st_mode):
+                return coding, suffix, stat_result
+    return None
+
+
+def _unhashed(path):
+    # before collectstatic has run, {% static %} still renders hashed names
+    match = HASHED_NAME.search(path)
+    return path[:match.start()] + '.' + match.group().rsplit('.', 1)[1]
+
+
+def serve(request, path, document_root=None, cache_control=None):
+    """
+    Serve a file below ``document_root`` with strong ETags, conditional
+    requests, single byte ranges and Cache-Control, preferring a ``.br`` or
+    ``.gz`` sibling the client accepts for text assets. Whole files go out as
+    a FileResponse, which WSGI servers hand to os.sendfile through
+    wsgi.file_wrapper; with FILE_SERVING['SENDFILE_BACKEND'] set the
+    transfer is handed to the front proxy instead.
+    """
+    immutable = bool(HASHED_NAME.search(path))
+    try:
+        fullpath = safe_join(document_root, path)
+        stat_result = os.stat(fullpath)
+    except ValueError:
+        raise Http404('File not found')
+    except OSError:
+        if not immutable:
+            raise Http404('File not found')
+        try:
+            path = _unhashed(path)
+            fullpath = safe_join(document_root, path)
+            stat_result = os.stat(fullpath)
+        except (ValueError, OSError):
+            raise Http404('File not found')
+        immutable = False
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('File not found')
+
+    if cache_control is None:
+        cache_control = get_setting('IMMUTABLE_CACHE_CONTROL' if immutable else 'CACHE_CONTROL')
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    vary = False
+    if encoding is None and COMPRESSIBLE_TYPES.match(content_type):
+        vary = True
+        variant = _precompressed(request, fullpath)
+        if variant is not None:
+            encoding, suffix, stat_result = variant
+            fullpath += suffix
+            path += suffix
+
+    size = stat_result.st_size
+    last_modified = int(stat_result.st_mtime)
+    etag = f'"{stat_result.st_mtime_ns:x}-{size:x}"'
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = cache_control
+        response['Accept-Ranges'] = 'bytes'
+        if vary:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        if encoding and response.status_code != 304:
+            response['Content-Encoding'] = encoding
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    backend = get_setting('SENDFILE_BACKEND')
+    if backend == 'x-accel-redirect':
+        # roots without an internal location are streamed from here
+        location = get_setting('ACCEL_REDIRECT_LOCATIONS').get(str(document_root))
+        if location is not None:
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = location.rstrip('/') + '/' + path.lstrip('/')
+            return finish(response)
+    elif backend:
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+        return finish(response)
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(range_header, size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return finish(response)
+
+    file = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        # bounded reader without fileno(): servers stream it instead of
+        # sending the rest of the file with sendfile
+        response = FileResponse(RangeReader(file, end - start + 1), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    return finish(response)